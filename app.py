@@ -1,107 +1,358 @@
 '''@author : Aloyse PHULPIN'''
 
-from dash import Dash, html, dash_table, dcc, callback, Output, Input, State, clientside_callback, ClientsideFunction, ctx, Patch, ALL, MATCH, State
+from dash import Dash, html, dash_table, dcc, callback, Output, Input, State, clientside_callback, ClientsideFunction, ctx, Patch, ALL, MATCH, State, DiskcacheManager
 from datetime import datetime, timedelta
 from dash.exceptions import PreventUpdate
-from threading import Timer
+from dash.long_callback.managers import BaseLongCallbackManager
+from threading import Timer, Lock
+from collections import OrderedDict
+from pandas.api.types import union_categoricals
+from contextlib import contextmanager
+from flask import g, request, Response, abort, has_request_context
 import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objs as go
+import plotly.io as pio
 import io 
 import webbrowser
 import base64
+import hashlib
+import re
+import os
+import sys
+import json
+import time
+import functools
+import itertools
+import secrets
+import diskcache
+import pyarrow as pa
 
 
 import dash_mantine_components as dmc
 from dash_iconify import DashIconify
 
 ############################ DEFINITION DES PARAMETRES ############################
-# Nombre de mois a remonter pour l'analyse
-period_in_month = 24
-invdate_mark= {str(datetime.today().replace(day=1,hour=0,minute=0, second=0, microsecond=0)-pd.DateOffset(months=23-i))[0:7] : i for i in range(24)}
-date_mark={v: k for k, v in invdate_mark.items()}
+# Horizon d'analyse en mois, compté depuis le dernier mois des données (jusqu'à plusieurs décennies)
+period_in_month = 240
+# Nombre de mois sélectionnés par défaut sur le RangeSlider
+mois_affiches = 24
+# Colonnes de l'export bancaire utilisées par le dashboard
+colonnes_export = ['Date opération', 'Libellé opération', 'Catégorie', 'Sous-catégorie', 'Montant', 'Opération pointée', 'RIB']
+# Colonnes textuelles en catégories en mémoire et en dictionnaire dans l'historique (valeurs distinctes stockées une seule fois)
+colonnes_dictionnaire = ['Libellé opération', 'Catégorie', 'Sous-catégorie', 'Opération pointée', 'RIB']
+# Ecart maximal (en euros) entre les montants d'une même dépense récurrente, 0 pour une égalité stricte
+tolerance_recurrence = 0
+# Colonne que les dépenses d'une même série récurrente doivent partager (marchand normalisé), None pour ne comparer que les montants
+libelle_recurrence = 'Marchand'
+# Nombre de marchands de l'histogramme des principaux marchands
+nb_marchands_affiches = 15
+# Nombre de lignes de la DataTable envoyées au navigateur par page
+taille_page_table = 50
+# Dossier de l'historique persistant des opérations (fichiers Arrow, un sous-dossier par propriétaire), None pour ne rien conserver entre deux lancements
+dossier_stockage = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'historique')
+# Cookie identifiant le navigateur propriétaire d'un historique, et sa durée de vie (en secondes)
+cookie_proprietaire = 'dashboard_proprietaire'
+duree_proprietaire = 365 * 24 * 3600
+# Budget mémoire (en octets) du cache des données prétraitées conservées côté serveur
+taille_max_cache = 512 * 1024**2
+# Dossier du registre des jeux de données partagé entre processus et des tâches des callbacks en arrière-plan
+dossier_echange = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+# Budget disque (en octets) du registre partagé, les jeux de données les moins récemment utilisés sont évincés au-delà
+taille_max_registre = 4 * 1024**3
+# Version du format des jeux de données du registre, à incrémenter quand leur représentation change (les anciens ne sont plus lus)
+version_donnees = 3
+# Durée (en secondes) sans interaction après laquelle une session et ses jeux de données expirent
+duree_session = 24 * 3600
+# Boxplot construit à partir des quartiles, moustaches et points aberrants calculés côté serveur (False : toutes les opérations sont envoyées au navigateur)
+statistiques_boxplot = True
+# Nombre maximal de points aberrants affichés par Sous-catégorie (les plus éloignés de la médiane)
+nb_max_points_aberrants = 200
+# Nombre de points au-delà duquel les nuages de points sont rendus en WebGL
+seuil_webgl = 1000
+# Nombre de barres au-delà duquel les histogrammes mensuels sont regroupés par trimestre, puis par année
+seuil_barres = 5000
+# Mesure des étapes de calcul (endpoint /metrics et en-tête Server-Timing), activée par DASHBOARD_INSTRUMENTATION=1
+# Les étapes du chargement des fichiers (callback en arrière-plan) apparaissent sur /metrics, pas dans l'en-tête Server-Timing
+instrumentation = os.environ.get('DASHBOARD_INSTRUMENTATION', '0') == '1'
+# Histogrammes exposés sur /metrics : nom -> (description, seuils des intervalles)
+histogrammes = {
+    'dashboard_etape_duree_secondes': ("Durée des étapes de calcul", [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]),
+    'dashboard_etape_lignes': ("Nombre de lignes en entrée des étapes de calcul", [1e2, 1e3, 1e4, 1e5, 1e6, 1e7]),
+    'dashboard_reponse_duree_secondes': ("Durée totale des requêtes de callback", [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]),
+    'dashboard_reponse_octets': ("Taille des réponses de callback", [1e3, 1e4, 1e5, 1e6, 1e7, 1e8]),
+}
+
+############################ INSTRUMENTATION ############################
+# Compteurs des histogrammes par (métrique, étape) : [effectifs par intervalle, somme des valeurs]
+_metriques = {}
+_verrou_metriques = Lock()
+
+def observation(metrique, etape, valeur):
+    """
+    Input :
+        metrique : nom de l'histogramme (clé de histogrammes)
+        etape : valeur du label etape
+        valeur : valeur observée
+    """
+    seuils = histogrammes[metrique][1]
+    with _verrou_metriques:
+        compteurs = _metriques.setdefault((metrique, etape), [np.zeros(len(seuils)+1, dtype=np.int64), 0.0])
+        compteurs[0][np.searchsorted(seuils, valeur)] += 1
+        compteurs[1] += valeur
+
+@contextmanager
+def etape(nom):
+    """
+    Mesure de la durée d'un bloc de code, ajoutée à l'en-tête Server-Timing de la requête en cours
+
+    Input :
+        nom : nom de l'étape (sans espace)
+
+    Output :
+        mesures : dictionnaire où le bloc peut renseigner 'lignes'
+    """
+    mesures = {}
+    if not instrumentation:
+        yield mesures
+        return
+    debut = time.perf_counter()
+    try:
+        yield mesures
+    finally:
+        duree = time.perf_counter() - debut
+        observation('dashboard_etape_duree_secondes', nom, duree)
+        if mesures.get('lignes') is not None:
+            observation('dashboard_etape_lignes', nom, mesures['lignes'])
+        if has_request_context():
+            g.setdefault('etapes', []).append((nom, duree))
+
+def instrumente(nom):
+    """
+    Décorateur mesurant chaque appel de la fonction comme une étape, avec le nombre de lignes de son premier argument dataframe
+    """
+    def decorateur(fonction):
+        @functools.wraps(fonction)
+        def fonction_instrumentee(*args, **kwargs):
+            if not instrumentation:
+                return fonction(*args, **kwargs)
+            with etape(nom) as mesures:
+                mesures['lignes'] = next((len(a) for a in args if isinstance(a, pd.DataFrame)), None)
+                return fonction(*args, **kwargs)
+        return fonction_instrumentee
+    return decorateur
+
+def releve_metriques():
+    """
+    Output :
+        releve : copie des compteurs {(métrique, étape) : (effectifs par intervalle, somme des valeurs)}
+    """
+    with _verrou_metriques:
+        return {cle: (compteurs[0].copy(), compteurs[1]) for cle, compteurs in _metriques.items()}
+
+def fusion_metriques(releve):
+    """
+    Input :
+        releve : compteurs {(métrique, étape) : (effectifs par intervalle, somme des valeurs)} ajoutés à ceux du processus
+    """
+    with _verrou_metriques:
+        for cle, (effectifs, somme) in releve.items():
+            compteurs = _metriques.setdefault(cle, [np.zeros_like(effectifs), 0.0])
+            compteurs[0] += effectifs
+            compteurs[1] += somme
+
+@contextmanager
+def metriques_transmises():
+    """
+    Observations d'un bloc exécuté dans un processus fils (callback en arrière-plan), perdues à la fin du processus si elles
+    restent dans ses compteurs : elles sont déposées dans le registre 'taches' et fusionnées par format_prometheus.
+    Elles apparaissent sur /metrics, mais pas dans l'en-tête Server-Timing de la requête (le bloc ne s'exécute pas dans une requête)
+    """
+    if not instrumentation:
+        yield
+        return
+    # Compteurs hérités du serveur web au fork : seule la différence est transmise
+    avant = releve_metriques()
+    try:
+        yield
+    finally:
+        difference = {}
+        for cle, (effectifs, somme) in releve_metriques().items():
+            effectifs_avant, somme_avant = avant.get(cle, (0, 0.0))
+            if (effectifs - effectifs_avant).any():
+                difference[cle] = (effectifs - effectifs_avant, somme - somme_avant)
+        if difference:
+            registre('taches').push(difference, prefix='metriques')
+
+def format_prometheus():
+    """
+    Output :
+        texte : histogrammes au format d'exposition texte de Prometheus, dont les observations transmises par les processus fils
+    """
+    while True:
+        _, releve = registre('taches').pull(prefix='metriques')
+        if releve is None:
+            break
+        fusion_metriques(releve)
+    lignes = []
+    with _verrou_metriques:
+        releve = {cle: (compteurs[0].cumsum(), compteurs[1]) for cle, compteurs in _metriques.items()}
+    for metrique, (description, seuils) in histogrammes.items():
+        lignes += [f'# HELP {metrique} {description}', f'# TYPE {metrique} histogram']
+        for (nom, etape_), (cumul, somme) in sorted(releve.items()):
+            if nom != metrique:
+                continue
+            for seuil, effectif in zip([f'{s:g}' for s in seuils]+['+Inf'], cumul):
+                lignes.append(f'{metrique}_bucket{{etape="{etape_}",le="{seuil}"}} {effectif}')
+            lignes.append(f'{metrique}_sum{{etape="{etape_}"}} {somme:g}')
+            lignes.append(f'{metrique}_count{{etape="{etape_}"}} {cumul[-1]}')
+    return '\n'.join(lignes) + '\n'
+
 
-def preprocessing(df, period_in_month):
+@instrumente('preprocessing')
+def preprocessing(df):
     """ 
     Encodage des données monétaire (initialement textuelle..)
     Attribution du type datetime
     Attribution de la catégorie épargne aux dépenses entre compte courant et compte d'épargne (bleu/jeune/epargne populaire)    
-    Création de la colonne Année-Mois opération
+    Création des colonnes Mois (code de la période mensuelle) et Marchand (libellé normalisé)
+    Représentation compacte : Montant en centimes entiers, colonnes textuelles en catégories
 
     Input : 
         df : dataframe
-        périod_in_month : entier naturel 
 
     Output : 
-        df_s : dataframe
+        df : dataframe
     """
     ############################ Formatage des données ############################
     df['Date opération']=pd.to_datetime(df['Date opération'], format='%d/%m/%Y')
-    df['Montant']=df['Montant'].replace('\,', '.', regex=True).astype('float')
-    df['Année-Mois opération']=df['Date opération'].apply(lambda x: str(x)[:7])
+    if df['Montant'].dtype == object:
+        df['Montant']=df['Montant'].str.replace(',', '.', regex=False).astype('float')
+    if df['Montant'].dtype.kind == 'f':
+        if df['Montant'].isna().any():
+            df=df.dropna(subset=['Montant'])
+        # Centimes entiers : sommes exactes et comparaisons d'égalité des montants sans erreur d'arrondi
+        df['Montant']=np.round(df['Montant'].to_numpy()*100).astype(np.int64)
+    df=df.astype({col: 'category' for col in colonnes_dictionnaire if col in df})
+    df['Marchand']=colonne_marchand(df['Libellé opération'])
+    # Code du mois : nombre de mois depuis janvier 1970 (ordinal de la pd.Period mensuelle)
+    df['Mois']=df['Date opération'].to_numpy().astype('datetime64[M]').astype(np.int16)
+
+    return df
 
-    # Sélection période max(df['Date opération'])
-    df_s=df[df['Date opération'].between(datetime.today()-pd.DateOffset(months=period_in_month), datetime.today())]
+def mois_en_date(mois):
+    """
+    Input :
+        mois : codes de mois (ordinal de la pd.Period mensuelle)
+    Output :
+        dates : premier jour de chaque mois (datetime64[ns])
+    """
+    return np.asarray(mois).astype('datetime64[M]').astype('datetime64[ns]')
 
-    return df_s
+def concatenation(dfs):
+    """
+    Input :
+        dfs : liste de dataframes d'opérations prétraitées
+    Output :
+        df : concaténation des opérations, les colonnes catégorielles réunissant (triées) les catégories de chaque dataframe
+    """
+    types = {col: pd.CategoricalDtype(union_categoricals([df[col] for df in dfs], sort_categories=True).categories)
+             for col in dfs[0].select_dtypes('category').columns}
+    return pd.concat([df.astype(types) for df in dfs], axis=0, ignore_index=True)
 
+@instrumente('sep_cost_income_ep')
 def sep_cost_income_ep(df_s):
     """
+    Séparation coût / revenue / épargne par masques : les opérations ne sont pas copiées,
+    les lignes d'un flux sont extraites par vue_flux au moment où elles sont utilisées
+
     Input :
         df_s : dataframe
 
     Output :
-        df_e : dataframe de l'épargne
-        df_c : dataframe des coûts
-        df_i : dataframe des revenus
-        df_ec : dataframe de l'épargne & des revenus  
+        m_e : masque booléen de l'épargne
+        m_c : masque booléen des coûts
+        m_i : masque booléen des revenus
+        m_ec : masque booléen de l'épargne & des coûts
     """
     ##################### DONNES HISTOGRAMME #####################
-    # Séparation coût / revenue / épargne
-    df_e=df_s[df_s['Catégorie']=='Epargne']
-    df_s=df_s[df_s['Catégorie']!='Epargne']
-    df_e['Montant']=df_e['Montant']*(-1)
+    m_e=(df_s['Catégorie']=='Epargne').to_numpy()
+    montant=df_s['Montant'].to_numpy()
 
-    df_c=df_s[df_s['Montant']<0]
-    df_c=df_c[df_c['Sous-catégorie']!='Virements internes']
-    df_c['Montant']= df_s['Montant']*(-1)
+    m_c=~m_e & (montant<0) & (df_s['Sous-catégorie']!='Virements internes').to_numpy()
+    m_i=~m_e & (montant>=0)
 
-    df_i=df_s[df_s['Montant']>=0]
+    return m_e, m_c, m_i, m_e | m_c
 
-    df_ec=pd.concat([df_e,df_c], axis=0)  
-    
-    return df_e, df_c, df_i, df_ec
+def vue_flux(df, masque, signe=-1):
+    """
+    Input :
+        df : dataframe des opérations (Montant en centimes)
+        masque : masque booléen des lignes du flux (sep_cost_income_ep)
+        signe : -1 pour l'épargne et les coûts (comptés positivement), 1 pour les revenus
+    Output :
+        vue : lignes du flux, Montant en euros
+    """
+    vue = df[masque]
+    return vue.assign(Montant=signe*vue['Montant'].to_numpy()/100)
 
-def data_conversion(df_c, df_ec, df_e, df_i, df_crec, dm, all_date):
+@instrumente('data_conversion')
+def data_conversion(df, axe, all_date):
     """
     Input :
-        df_c : dataframe des coûts
-        df_ec : dataframe de l'épargne & des revenus 
-        df_e : dataframe de l'épargne
-        df_i : dataframe des revenus
-        dm : dictionnaire de l'index d'Année Mois sur RangeSlider {'Année Mois' : Index}
-        all_date : liste de la borne inf et sup d'Année Mois 
+        df : dataframe (coûts, épargne, revenus...)
+        axe : index mensuel du RangeSlider (pd.PeriodIndex)
+        all_date : liste de la borne inf et sup d'Année Mois (positions sur l'axe)
 
     Output :
-        df_c : dataframe des coûts filtré sur Année-Mois opération converti en date selon all_date
-        df_e : dataframe de l'épargne filtré sur Année-Mois opération converti en date selon all_date
-        df_ec : dataframe de l'épargne & des revenus filtré sur Année-Mois opération converti en date selon all_date
-        df_i : dataframe des revenus filtré sur Année-Mois opération converti en date selon all_date
+        df : dataframe filtré sur les mois sélectionnés, par comparaison des codes de mois
     """
-    df_c['Année-Mois opération']=pd.to_datetime(df_c['Année-Mois opération'])
-    df_ec['Année-Mois opération']=pd.to_datetime(df_ec['Année-Mois opération'])
-    df_e['Année-Mois opération']=pd.to_datetime(df_e['Année-Mois opération'])
-    df_i['Année-Mois opération']=pd.to_datetime(df_i['Année-Mois opération'])
-    df_crec['Année-Mois opération']=pd.to_datetime(df_crec['Année-Mois opération'])
-    
-    df_e=df_e[df_e['Année-Mois opération'].between(pd.to_datetime(dm[all_date[0]]),pd.to_datetime(dm[all_date[1]]))]
-    df_c=df_c[df_c['Année-Mois opération'].between(pd.to_datetime(dm[all_date[0]]),pd.to_datetime(dm[all_date[1]]))]
-    df_i=df_i[df_i['Année-Mois opération'].between(pd.to_datetime(dm[all_date[0]]),pd.to_datetime(dm[all_date[1]]))]
-    df_e=df_e[df_e['Année-Mois opération'].between(pd.to_datetime(dm[all_date[0]]),pd.to_datetime(dm[all_date[1]]))]
-    df_crec=df_crec[df_crec['Année-Mois opération'].between(pd.to_datetime(dm[all_date[0]]),pd.to_datetime(dm[all_date[1]]))]
-    return df_c, df_ec, df_e, df_i, df_crec
+    debut, fin = bornes_mois(axe, all_date)
+    mois = df['Mois'].to_numpy()
+    return df[(mois >= debut.ordinal) & (mois <= fin.ordinal)]
+
+def axe_mois(df=None):
+    """
+    Input :
+        df : dataframe des opérations, None pour un dashboard vide
+    Output :
+        axe : index mensuel du RangeSlider (pd.PeriodIndex) : mois des données dans la limite de l'horizon d'analyse,
+              les mois_affiches derniers mois pour un dashboard vide
+    """
+    if df is None or df.empty:
+        return pd.period_range(end=pd.Timestamp.today(), periods=mois_affiches, freq='M')
+    fin = int(df['Mois'].max())
+    debut = max(int(df['Mois'].min()), fin-period_in_month+1)
+    return pd.period_range(start=pd.Period(ordinal=debut, freq='M'), periods=fin-debut+1, freq='M')
+
+def bornes_mois(axe, all_date):
+    """
+    Input :
+        axe : index mensuel du RangeSlider (pd.PeriodIndex)
+        all_date : liste de la borne inf et sup d'Année Mois (positions sur l'axe)
+    Output :
+        debut, fin : mois (pd.Period) bornes de la sélection, ramenées sur l'axe (la valeur du RangeSlider
+                     peut encore correspondre à l'axe du jeu de données précédent)
+    """
+    debut = min(max(int(all_date[0]), 0), len(axe)-1)
+    fin = min(max(int(all_date[1]), debut), len(axe)-1)
+    return axe[debut], axe[fin]
+
+def marques_mois(axe):
+    """
+    Input :
+        axe : index mensuel du RangeSlider (pd.PeriodIndex)
+    Output :
+        marks : repères du RangeSlider {position : libellé}, un par mois pour un axe court, sinon un par année (janvier)
+                espacés pour ne pas dépasser mois_affiches repères
+    """
+    if len(axe) <= mois_affiches:
+        return {i: str(p) for i, p in enumerate(axe)}
+    pas = -(-len(axe) // (12*mois_affiches))
+    return {i: str(p.year) for i, p in enumerate(axe) if p.month == 1 and p.year % pas == 0}
 
+@instrumente('sunburst_data')
 def sunburst_data(df_e, df_c):
     """
     Input :
@@ -112,58 +363,778 @@ def sunburst_data(df_e, df_c):
     """
     ##################### DONNES SUNBURST #####################
     # Répartition des dépenses
-    df_selec1=df_e.groupby(['Année-Mois opération', 'Catégorie']).sum('Montant')
-    df_selec1['Sous-catégorie']=['Sans sous cat']*len(df_selec1)
-    df_selec1[df_selec1.index.names[0]]=[df_selec1.index[i][0] for i in range(len(df_selec1))]
-    df_selec1[df_selec1.index.names[1]]=[df_selec1.index[i][1] for i in range(len(df_selec1))]
-    df_selec1.index=[i for i in range(len(df_selec1))]
+    df_selec1=df_e.groupby(['Année-Mois opération', 'Catégorie'], observed=True)['Montant'].sum().reset_index()
+    df_selec1['Sous-catégorie']='Sans sous cat'
 
-    df_sunburst=pd.concat([df_selec1, df_c[['Année-Mois opération', 'Catégorie', 'Sous-catégorie', 'Montant']]], axis=0)
-
-    df_sunburst['Année-Mois opération']=np.array(pd.to_datetime(df_sunburst['Année-Mois opération']))
+    df_sunburst=pd.concat([df_selec1, df_c[['Année-Mois opération', 'Catégorie', 'Sous-catégorie', 'Montant']]], axis=0, ignore_index=True)
     
     return df_sunburst
 
-def depense_recurrente(df_c):
-    
-    res=pd.DataFrame(columns=['Année-Mois opération', 'Libellé opération', 'Catégorie', 'Sous-catégorie', 'Montant'])
-    for i in range(2, df_c['Année-Mois opération'].nunique()):
-        month1=df_c[df_c['Année-Mois opération']==np.sort(df_c['Année-Mois opération'].unique())[i-2]]
-        month2=df_c[df_c['Année-Mois opération']==np.sort(df_c['Année-Mois opération'].unique())[i-1]]
-        month3=df_c[df_c['Année-Mois opération']==np.sort(df_c['Année-Mois opération'].unique())[i]]
-        
-        commun=month2[month2['Montant'].isin(month1['Montant'].unique())]
-        commun=month3[month3['Montant'].isin(commun['Montant'].unique())]
-        commun=commun[['Année-Mois opération', 'Libellé opération', 'Catégorie', 'Sous-catégorie','Montant']]
-        #commun=commun[['Année-Mois opération']==np.sort(df['Année-Mois opération'].unique())[i]]
-        #commun=commun[commun['Année-Mois opération']==np.sort(df['Année-Mois opération'].unique())[i]]
-        res=pd.concat([res,commun], axis=0)
-
-    #res['Id']=res['Montant'].astype(str)+'€'   
-    return res.groupby(['Année-Mois opération', 'Libellé opération', 'Catégorie', 'Sous-catégorie']).sum('Montant').reset_index()
+@instrumente('cube_mensuel')
+def cube_mensuel(df_e, df_c, df_i, cube=None):
+    """
+    Agrégation des montants par flux (cost / income / ep), Catégorie, Sous-catégorie et Mois
+    Les graphiques mensuels sont construits à partir de ce cube, sans regrouper à nouveau les opérations
 
-def parse_data(contents, filename):
+    Input :
+        df_e : dataframe de l'épargne
+        df_c : dataframe des coûts
+        df_i : dataframe des revenus
+        cube : cube existant auquel ajouter les montants, None pour un nouveau cube
+
+    Output :
+        cube : dataframe (Flux, Catégorie, Sous-catégorie, Mois, Montant, Année-Mois opération) trié selon ses clés
+    """
+    colonnes = ['Flux', 'Catégorie', 'Sous-catégorie', 'Mois']
+    flux = [df[colonnes[1:]+['Montant']].assign(Flux=nom) for nom, df in [('cost', df_c), ('income', df_i), ('ep', df_e)]]
+    flux = pd.concat(flux, axis=0).groupby(colonnes, observed=True)['Montant'].sum().reset_index()
+    flux = flux.astype({'Catégorie': object, 'Sous-catégorie': object})
+    if cube is not None:
+        # Ajout aux cellules existantes : seules les cellules des opérations ajoutées changent
+        flux = pd.concat([cube[colonnes+['Montant']], flux], axis=0).groupby(colonnes)['Montant'].sum().reset_index()
+    flux['Année-Mois opération'] = mois_en_date(flux['Mois'])
+    return flux
+
+def epargne_mensuelle(cube):
+    """
+    Input :
+        cube : cube mensuel
+    Output :
+        df_bar_ep : dataframe de l'épargne sommée par Année-Mois opération, acquise ou consommée
+    """
+    df_bar_ep=selection_cube(cube, 'ep').groupby('Année-Mois opération')['Montant'].sum().reset_index()
+    df_bar_ep['Catégorie']=np.where(df_bar_ep['Montant']<0, "Epargne consommée", "Epargne acquise")
+    return df_bar_ep
+
+@instrumente('selection_cube')
+def selection_cube(cube, flux, axe=None, all_date=None, categories=None):
+    """
+    Input :
+        cube : cube mensuel
+        flux : 'cost', 'income' ou 'ep'
+        axe : index mensuel du RangeSlider (pd.PeriodIndex)
+        all_date : liste de la borne inf et sup d'Année Mois (positions sur l'axe), None pour toute la période
+        categories : liste des catégories sélectionnées, None pour toutes les catégories
+
+    Output :
+        cube : cellules du cube du flux sur la période et les catégories sélectionnées
+    """
+    masque = cube['Flux'].to_numpy() == flux
+    if all_date is not None:
+        debut, fin = bornes_mois(axe, all_date)
+        mois = cube['Mois'].to_numpy()
+        masque &= (mois >= debut.ordinal) & (mois <= fin.ordinal)
+    if categories is not None:
+        masque &= cube['Catégorie'].isin(categories).to_numpy()
+    return cube[masque]
+
+def presence(cles, requetes, tolerance=0):
+    """
+    Input :
+        cles : tableau trié des clés présentes
+        requetes : tableau des clés recherchées
+        tolerance : écart maximal accepté entre une clé recherchée et une clé présente
+
+    Output :
+        masque : tableau booléen, vrai si une clé présente est à moins de tolerance de la clé recherchée
+    """
+    debut = np.searchsorted(cles, requetes-tolerance, side='left')
+    fin = np.searchsorted(cles, requetes+tolerance, side='right')
+    return fin > debut
+
+@instrumente('depense_recurrente')
+def depense_recurrente(df_c, tolerance=0, libelle=None):
+    """
+    Détection des dépenses récurrentes : une dépense est récurrente si son montant est aussi dépensé
+    les deux mois précédents de l'historique (mois présents dans df_c)
+    Les séries sont recherchées en une passe sur les couples (mois, montant) présents
+
+    Input :
+        df_c : dataframe des coûts
+        tolerance : écart maximal (en euros) entre les montants d'une même série, 0 pour une égalité stricte
+        libelle : colonne (libellé normalisé...) que les dépenses d'une même série doivent partager, None pour ne comparer que les montants
+
+    Output :
+        df_crec : dataframe des dépenses récurrentes sommées par Mois, Libellé opération, Catégorie et Sous-catégorie (et Année-Mois opération)
+    """
+    colonnes = ['Mois', 'Libellé opération', 'Catégorie', 'Sous-catégorie']
+
+    # Rang du mois dans l'historique, décalé par série de libellé le cas échéant
+    rang_mois, mois = pd.factorize(df_c['Mois'], sort=True)
+    rang = rang_mois.astype('int64')
+    if libelle is not None:
+        rang += pd.factorize(df_c[libelle], use_na_sentinel=False)[0].astype('int64')*(len(mois)+2)
+
+    if tolerance:
+        # Clé réelle : rang*decalage + montant, le décalage séparant les montants de deux mois consécutifs
+        montant = df_c['Montant'].to_numpy(dtype='float64')
+        montant = montant - (montant.min() if len(montant) else 0)
+        decalage = (montant.max() if len(montant) else 0) + 2*tolerance + 1
+        cles = rang*decalage + montant
+    else:
+        # Clé entière : rang*nb_montants + code du montant
+        code, montants = pd.factorize(df_c['Montant'], use_na_sentinel=False)
+        decalage = len(montants)
+        cles = rang*decalage + code
+    cles_presentes = np.unique(cles)
+
+    # Présence de la clé dans les deux mois précédents
+    recurrent = rang_mois >= 2
+    for k in (1, 2):
+        # Marge d'arrondi sur les clés réelles pour qu'un écart égal à la tolérance soit accepté
+        recurrent &= presence(cles_presentes, cles-k*decalage, tolerance+1e-6 if tolerance else 0)
+
+    res = df_c.loc[recurrent, colonnes+['Montant']].astype({'Montant': 'float64', 'Libellé opération': object, 'Catégorie': object, 'Sous-catégorie': object})
+    res = res.groupby(colonnes).sum('Montant').reset_index()
+    res['Année-Mois opération'] = mois_en_date(res['Mois'])
+    return res
+
+@instrumente('depense_recurrente_incrementale')
+def depense_recurrente_incrementale(df_c, df_crec, mois_modifies, tolerance=0, libelle=None):
+    """
+    Mise à jour des dépenses récurrentes après l'ajout de dépenses : seuls les mois modifiés et les deux mois
+    suivants de l'historique sont recalculés, à partir de leurs deux mois précédents
+
+    Input :
+        df_c : dataframe des coûts (dépenses ajoutées comprises)
+        df_crec : dataframe des dépenses récurrentes avant l'ajout
+        mois_modifies : liste des codes de Mois des dépenses ajoutées
+        tolerance : écart maximal (en euros) entre les montants d'une même série
+        libelle : colonne que les dépenses d'une même série doivent partager (depense_recurrente)
+
+    Output :
+        df_crec : dataframe des dépenses récurrentes à jour
+    """
+    colonnes = ['Mois', 'Libellé opération', 'Catégorie', 'Sous-catégorie']
+    mois = np.sort(df_c['Mois'].unique())
+    rang = np.searchsorted(mois, np.unique(np.asarray(mois_modifies, dtype=mois.dtype)))
+    if len(rang) == 0:
+        return df_crec
+
+    recalcul = np.unique(np.clip(np.concatenate([rang, rang+1, rang+2]), 0, len(mois)-1))
+    entree = np.unique(np.clip(np.concatenate([recalcul, recalcul-1, recalcul-2]), 0, None))
+
+    # Les deux mois précédant un mois recalculé sont conservés : son rang relatif dans l'extrait reste valable
+    res = depense_recurrente(df_c[df_c['Mois'].isin(mois[entree])], tolerance, libelle)
+    res = res[res['Mois'].isin(mois[recalcul])]
+    df_crec = df_crec[~df_crec['Mois'].isin(mois[recalcul])]
+    return pd.concat([df_crec, res], axis=0).sort_values(colonnes).reset_index(drop=True)
+
+@instrumente('lecture_csv')
+def lecture_csv(fichier):
     """
+    Lecture d'un export bancaire (séparateur ';', décimale ',', BOM éventuel, fins de ligne LF ou CRLF)
+    par le parseur C de pandas, limitée aux colonnes utilisées par le dashboard
+
     Input :
+        fichier : chemin ou flux binaire du fichier csv
+
     Output :
+        df : dataframe, Date opération en date et Montant en réel
     """
-    content_type, content_string = contents.split(",")
-    decoded = base64.b64decode(content_string)
-    decoded=decoded.decode("utf-8")
-    data=decoded.split('\r\n')
-    data=[data[i].split(';') for i in range(len(data))]
-    df = pd.DataFrame(data[1:len(data)-1], columns=data[0])
+    df = pd.read_csv(
+        fichier,
+        sep=';',
+        decimal=',',
+        encoding='utf-8-sig',
+        usecols=lambda col: col in colonnes_export,
+        dtype={col: 'str' for col in colonnes_export if col!='Montant'},
+        keep_default_na=False,
+        na_values={'Montant': ['']},
+    )
+    # Conversion des dates après lecture : format explicite, plus rapide que parse_dates combiné au typage des colonnes
+    df['Date opération']=pd.to_datetime(df['Date opération'], format='%d/%m/%Y')
     return df
+
+def parse_data(contents, filename):
+    """
+    Input :
+        contents : contenu du fichier uploadé (base64)
+        filename : nom du fichier
+
+    Output :
+        df : dataframe des colonnes utiles du fichier
+    """
+    with etape('decodage'):
+        content_type, content_string = contents.split(",")
+        decoded = base64.b64decode(content_string)
+    return lecture_csv(io.BytesIO(decoded))
+
+############################ MARCHANDS ############################
+# Normalisation des libellés, appliquée dans l'ordre sur les libellés en majuscules sans accents :
+# 'PAIEMENT CB 1209 HELP.UBER.COM UBER *EATS CARTE 8720' -> 'HELP UBER COM UBER EATS'
+motifs_marchand = [
+    # Retraits d'espèces regroupés quel que soit le distributeur
+    (re.compile(r"^RETRAIT\s+(?:DAB|GAB)\b.*$"), 'RETRAIT DAB'),
+    # Type d'opération et date (jjmm) en tête de libellé
+    (re.compile(r"^(?:PAIEMENT\s+(?:CB|PSC|CARTE)|ACHAT\s+CB|PRLV|PRELEVEMENT|VIR(?:EMENT)?)(?:\s+(?:SEPA|INST|RECU|EMIS|PERMANENT))*\s+(?:\d{4}\s+)?"), ''),
+    # Numéro de carte en fin de libellé
+    (re.compile(r"\s+(?:CARTE|CB)\s*[*X\d]+\s*$"), ''),
+    # Dates, références et numéros (de chèque, de magasin...) : tout mot contenant un chiffre
+    (re.compile(r"\S*\d\S*"), ' '),
+    # Ponctuation et espaces multiples
+    (re.compile(r"[^A-Z&' ]+"), ' '),
+    (re.compile(r"\s{2,}"), ' '),
+]
+
+def normalisation_libelles(libelles):
+    """
+    Input :
+        libelles : série des libellés d'opération
+    Output :
+        marchands : série des libellés normalisés (marchand), le libellé en majuscules s'il ne reste rien après normalisation
+    """
+    majuscules = libelles.str.upper().str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+    marchands = majuscules
+    for motif, remplacement in motifs_marchand:
+        marchands = marchands.str.replace(motif, remplacement, regex=True)
+    marchands = marchands.str.strip()
+    return marchands.where(marchands != '', majuscules.str.strip())
+
+def colonne_marchand(libelles):
+    """
+    Input :
+        libelles : colonne catégorielle Libellé opération
+    Output :
+        marchand : colonne catégorielle du marchand, seuls les libellés distincts sont normalisés
+    """
+    code_marchand, marchands = pd.factorize(normalisation_libelles(libelles.cat.categories.to_series()), sort=True)
+    codes = libelles.cat.codes.to_numpy()
+    codes = np.where(codes >= 0, code_marchand[np.maximum(codes, 0)] if len(code_marchand) else -1, -1)
+    return pd.Categorical.from_codes(codes, categories=marchands)
+
+@instrumente('index_marchands')
+def index_marchands(df):
+    """
+    Index inversé des marchands : les positions des opérations d'un marchand sont contiguës dans lignes
+
+    Input :
+        df : dataframe des opérations (colonne Marchand)
+    Output :
+        index : dataframe indexé par Marchand (Début, Fin : bornes des positions du marchand dans lignes)
+        lignes : positions des opérations triées par marchand (ordre des opérations conservé pour un même marchand)
+    """
+    codes = df['Marchand'].cat.codes.to_numpy()
+    lignes = np.argsort(codes, kind='stable').astype(np.int32)
+    bornes = np.searchsorted(codes[lignes], np.arange(len(df['Marchand'].cat.categories)+1))
+    index = pd.DataFrame({'Début': bornes[:-1], 'Fin': bornes[1:]}, index=df['Marchand'].cat.categories)
+    return index, lignes
+
+def operations_marchand(donnees, marchand):
+    """
+    Input :
+        donnees : jeu de données (transactions, marchands, lignes_marchands)
+        marchand : marchand normalisé
+    Output :
+        df : opérations du marchand, lues par l'index inversé sans parcourir les libellés
+    """
+    if marchand not in donnees['marchands'].index:
+        return donnees['transactions'].iloc[0:0]
+    debut, fin = donnees['marchands'].loc[marchand, ['Début', 'Fin']]
+    return donnees['transactions'].iloc[donnees['lignes_marchands'][debut:fin]]
+
+@instrumente('top_marchands')
+def top_marchands(df, axe, all_date, nombre=nb_marchands_affiches):
+    """
+    Input :
+        df : dataframe des opérations (colonne Marchand)
+        axe : index mensuel du RangeSlider (pd.PeriodIndex)
+        all_date : liste de la borne inf et sup d'Année Mois (positions sur l'axe)
+        nombre : nombre de marchands
+    Output :
+        df_marchands : dataframe (Marchand, Montant, Opérations) des marchands aux dépenses les plus élevées
+                       sur les mois sélectionnés, sommées par code de marchand
+    """
+    df_cost = data_conversion(vue_flux(df, sep_cost_income_ep(df)[1]), axe, all_date)
+    codes = df_cost['Marchand'].cat.codes.to_numpy()
+    montant = df_cost['Montant'].to_numpy()[codes >= 0]
+    codes = codes[codes >= 0]
+    marchands = df_cost['Marchand'].cat.categories
+    montants = np.bincount(codes, weights=montant, minlength=len(marchands))
+    top = np.argsort(-montants, kind='stable')[:nombre]
+    top = top[montants[top] > 0]
+    return pd.DataFrame({'Marchand': marchands[top], 'Montant': montants[top],
+                         'Opérations': np.bincount(codes, minlength=len(marchands))[top]})
+
+############################ CACHE DES DONNEES ############################
+# Cache LRU des jeux de données prétraités : {identifiant du jeu de données : (donnees, taille en octets)}
+_cache_donnees = OrderedDict()
+_verrou_cache = Lock()
+# Un seul prétraitement à la fois entre les threads d'un même processus (chargements de l'historique du serveur web).
+# Chaque upload s'exécute dans son propre processus fils avec un verrou neuf (reinitialisation_verrous) : deux uploads
+# simultanés ne sont pas sérialisés et peuvent lire les mêmes fichiers, le registre 'donnees' ne garde qu'un jeu par contenu
+_verrou_chargement = Lock()
+
+def taille_donnees(donnees):
+    """
+    Occupation mémoire des colonnes textuelles estimée sur un échantillon d'un millier de valeurs :
+    le calcul exact (memory_usage(deep=True)) parcourt chaque chaîne et coûte plus que le prétraitement
+
+    Input :
+        donnees : jeu de données (dictionnaire de dataframes)
+    Output :
+        taille : occupation mémoire totale des dataframes en octets
+    """
+    taille = 0
+    for df in donnees.values():
+        if isinstance(df, np.ndarray):
+            taille += df.nbytes
+        if not isinstance(df, pd.DataFrame):
+            continue
+        taille += df.memory_usage(deep=False).sum()
+        for col in df.select_dtypes('category').columns:
+            taille += df[col].cat.categories.memory_usage(deep=True)
+        for col in df.columns[(df.dtypes == object).to_numpy()]:
+            echantillon = df[col].iloc[::max(1, len(df)//1000)]
+            taille += len(df)*echantillon.map(sys.getsizeof).mean() if len(df) else 0
+    return int(taille)
+
+def taille_cache(cle):
+    """
+    Input :
+        cle : identifiant du jeu de données
+    Output :
+        taille : occupation mémoire du jeu de données en cache en octets, 0 s'il n'est pas en cache
+    """
+    with _verrou_cache:
+        return _cache_donnees[cle][1] if cle in _cache_donnees else 0
+
+def mise_en_cache(cle, donnees, taille=None):
+    """
+    Input :
+        cle : identifiant du jeu de données
+        donnees : jeu de données
+        taille : occupation mémoire du jeu de données en octets, calculée si elle n'est pas fournie
+    """
+    taille = taille_donnees(donnees) if taille is None else taille
+    with _verrou_cache:
+        _cache_donnees[cle] = (donnees, taille)
+        _cache_donnees.move_to_end(cle)
+        # Eviction des jeux de données les moins récemment utilisés au-delà du budget mémoire
+        while len(_cache_donnees) > 1 and sum(t for _, t in _cache_donnees.values()) > taille_max_cache:
+            _cache_donnees.popitem(last=False)
+
+def lecture_donnees(cle):
+    """
+    Les dataframes renvoyés sont partagés entre les callbacks : ils ne doivent pas être modifiés
+
+    Input :
+        cle : identifiant du jeu de données
+    Output :
+        donnees : jeu de données {'transactions', 'costrec', 'cube', 'marchands', 'lignes_marchands', 'mois', 'fichiers', 'noms'},
+                  None s'il n'est pas en cache
+    """
+    with _verrou_cache:
+        if cle in _cache_donnees:
+            _cache_donnees.move_to_end(cle)
+            return _cache_donnees[cle][0]
+
+    # Jeu de données préparé par un autre processus (callback en arrière-plan, autre worker du serveur)
+    donnees = registre('donnees').get(cle) if cle else None
+    if donnees is not None:
+        mise_en_cache(cle, donnees)
+    return donnees
+
+def reinitialisation_verrous():
+    """
+    Verrous neufs dans les processus fils : un verrou détenu par un autre thread au moment du fork ne serait jamais libéré
+    """
+    global _verrou_cache, _verrou_chargement, _verrou_metriques
+    _verrou_cache, _verrou_chargement, _verrou_metriques = Lock(), Lock(), Lock()
+
+os.register_at_fork(after_in_child=reinitialisation_verrous)
+
+def identifiant_operations(df):
+    """
+    Identifiant stable d'une opération : date, libellé, montant, RIB et rang d'occurrence de l'opération identique dans le fichier
+    Deux opérations identiques d'un même export sont conservées, la même opération présente dans deux exports n'est comptée qu'une fois
+
+    Input :
+        df : dataframe d'un fichier
+    Output :
+        identifiant : tableau d'entiers (empreinte de la clé de l'opération)
+    """
+    cle = df[['Date opération', 'Libellé opération', 'Montant', 'RIB']]
+    occurrence = cle.groupby(list(cle.columns), sort=False, dropna=False).cumcount()
+    return pd.util.hash_pandas_object(cle.assign(Occurrence=occurrence), index=False).to_numpy()
+
+def preparation_operations(df):
+    """
+    Input :
+        df : dataframe lu d'un export (parse_data, lecture_csv)
+    Output :
+        df : opérations prétraitées et identifiées (colonne Identifiant), RIB vide s'il est absent de l'export
+    """
+    if 'RIB' not in df:
+        df['RIB'] = ''
+    df['Identifiant'] = identifiant_operations(df)
+    return preprocessing(df)
+
+def cle_fichiers(fichiers):
+    """
+    Input :
+        fichiers : dictionnaire {empreinte du contenu : nom} des fichiers du jeu de données
+    Output :
+        cle : identifiant du jeu de données, empreinte de l'ensemble de ses fichiers quel que soit l'ordre d'upload
+    """
+    return hashlib.sha256('|'.join(sorted(fichiers)).encode()).hexdigest()
+
+def construction_donnees(df_courant, fichiers, progression=lambda texte: None):
+    """
+    Input :
+        df_courant : dataframe des opérations prétraitées
+        fichiers : dictionnaire {empreinte du contenu : nom} des fichiers dont proviennent les opérations
+        progression : fonction appelée avec le libellé de chaque étape
+
+    Output :
+        donnees : jeu de données
+        taille : occupation mémoire du jeu de données en octets
+    """
+    m_e, m_c, m_i, m_ec = sep_cost_income_ep(df_courant)
+    df_cost = vue_flux(df_courant, m_c)
+    progression("Détection des dépenses récurrentes")
+    df_costrec = depense_recurrente(df_cost, tolerance_recurrence, libelle_recurrence)
+    progression("Construction du cube mensuel")
+    cube = cube_mensuel(vue_flux(df_courant, m_e), df_cost, vue_flux(df_courant, m_i, 1))
+    index, lignes = index_marchands(df_courant)
+    # Seules les opérations sont conservées : les flux sont des masques recalculés à la demande
+    donnees = {'transactions': df_courant, 'costrec': df_costrec, 'cube': cube, 'marchands': index, 'lignes_marchands': lignes,
+               'mois': axe_mois(df_courant), 'fichiers': fichiers, 'noms': sorted(fichiers.values())}
+    return donnees, taille_donnees(donnees)
+
+def ajout_fichiers(cle, contents, filename, progression=lambda texte: None, proprietaire=None):
+    """
+    Ajout de fichiers uploadés à un jeu de données : seuls les fichiers pas encore chargés sont lus et prétraités,
+    les opérations déjà présentes sont écartées et les dépenses récurrentes ne sont recalculées que sur les mois modifiés
+
+    Input :
+        cle : identifiant du jeu de données existant, None pour un nouveau jeu de données
+        contents : liste des contenus des fichiers uploadés (base64)
+        filename : liste des noms de fichier
+        progression : fonction appelée avec le libellé de chaque étape (len(contents) + 3 étapes)
+        proprietaire : jeton du propriétaire dont l'historique reçoit les opérations ajoutées, None pour ne pas les conserver
+
+    Output :
+        cle : identifiant du nouveau jeu de données
+    """
+    with _verrou_chargement:
+        donnees = lecture_donnees(cle) if cle else None
+        fichiers = dict(donnees['fichiers']) if donnees else {}
+
+        nouveaux, fichiers_ajoutes = [], {}
+        for contenu, nom in zip(contents, filename):
+            progression(f"Lecture de {nom}")
+            empreinte = hashlib.sha256(contenu.encode()).hexdigest()
+            if empreinte in fichiers:
+                continue
+            fichiers_ajoutes[empreinte] = nom
+            nouveaux.append(preparation_operations(parse_data(contenu, nom)))
+            fichiers[empreinte] = nom
+
+        if not nouveaux:
+            return cle
+
+        # Opérations nouvelles : absentes du jeu de données existant et dédoublonnées entre les fichiers ajoutés
+        df_nouveau = concatenation(nouveaux).drop_duplicates('Identifiant')
+        if donnees:
+            df_nouveau = df_nouveau[~np.isin(df_nouveau['Identifiant'].to_numpy(), donnees['transactions']['Identifiant'].to_numpy())]
+
+        # Jeu de données déjà construit (par une autre session) : seul l'historique du propriétaire est complété
+        nouvelle_cle = cle_fichiers(fichiers)
+        if lecture_donnees(nouvelle_cle) is not None:
+            ecriture_stockage(df_nouveau, fichiers_ajoutes, proprietaire)
+            return nouvelle_cle
+
+        if donnees:
+            m_e, m_c, m_i, m_ec = sep_cost_income_ep(df_nouveau)
+            # Taille mise à jour à partir des seules opérations ajoutées
+            taille = taille_cache(cle) + taille_donnees({'transactions': df_nouveau}) - taille_donnees({k: donnees[k] for k in ['costrec', 'cube', 'marchands', 'lignes_marchands']})
+            transactions = concatenation([donnees['transactions'], df_nouveau])
+            progression("Détection des dépenses récurrentes")
+            df_cost = vue_flux(transactions, sep_cost_income_ep(transactions)[1])
+            df_costrec = depense_recurrente_incrementale(df_cost, donnees['costrec'], df_nouveau['Mois'].unique(), tolerance_recurrence, libelle_recurrence)
+            progression("Construction du cube mensuel")
+            cube = cube_mensuel(vue_flux(df_nouveau, m_e), vue_flux(df_nouveau, m_c), vue_flux(df_nouveau, m_i, 1), donnees['cube'])
+            index, lignes = index_marchands(transactions)
+            taille += taille_donnees({'costrec': df_costrec, 'cube': cube, 'marchands': index, 'lignes_marchands': lignes})
+            donnees = dict(transactions=transactions, costrec=df_costrec, cube=cube, marchands=index, lignes_marchands=lignes,
+                           mois=axe_mois(transactions), fichiers=fichiers, noms=sorted(fichiers.values()))
+        else:
+            donnees, taille = construction_donnees(df_nouveau, fichiers, progression)
+
+        progression("Enregistrement")
+        mise_en_cache(nouvelle_cle, donnees, taille)
+        enregistrement_donnees(nouvelle_cle, donnees)
+        ecriture_stockage(df_nouveau, fichiers_ajoutes, proprietaire)
+    return nouvelle_cle
     
-app = Dash(__name__)
+############################ REGISTRE DES SESSIONS ############################
+# Registre partagé entre les processus (workers du serveur, callbacks en arrière-plan) :
+#   registre('donnees') : {clé du contenu : jeu de données}, borné en taille avec éviction LRU
+#   registre('sessions') : {identifiant court : {'session', 'cle'}}, seul l'identifiant est envoyé au navigateur,
+#                          et {('proprietaire', jeton de session) : jeton du propriétaire de son historique}
+#   registre('taches') : tâches des callbacks en arrière-plan (GestionnaireTaches) et mesures de leurs étapes
+
+@functools.cache
+def registre(nom):
+    """
+    Registres ouverts au premier accès : importer app sans servir le dashboard (rapports.py) ne crée pas le dossier d'échange
+
+    Input :
+        nom : 'donnees', 'sessions' ou 'taches'
+    Output :
+        registre : cache disque (diskcache.Cache) du dossier d'échange
+    """
+    if nom == 'donnees':
+        return diskcache.Cache(os.path.join(dossier_echange, f'donnees-v{version_donnees}'), size_limit=taille_max_registre, eviction_policy='least-recently-used')
+    return diskcache.Cache(os.path.join(dossier_echange, nom))
+
+def enregistrement_donnees(cle, donnees):
+    """
+    Publication du jeu de données pour les autres processus, dont le cache mémoire n'est pas partagé
+
+    Input :
+        cle : clé du contenu du jeu de données
+        donnees : jeu de données
+    """
+    if cle not in registre('donnees'):
+        registre('donnees').set(cle, donnees, expire=duree_session)
+
+def enregistrement_session(cle, session):
+    """
+    Input :
+        cle : clé du contenu du jeu de données
+        session : jeton de la session propriétaire
+    Output :
+        identifiant : identifiant court du jeu de données pour cette session
+    """
+    identifiant = secrets.token_urlsafe(8)
+    registre('sessions').set(identifiant, {'session': session, 'cle': cle}, expire=duree_session)
+    return identifiant
+
+def enregistrement_proprietaire(session, proprietaire):
+    """
+    Input :
+        session : jeton de la session
+        proprietaire : jeton du propriétaire de l'historique de la session, None pour une session sans historique
+    """
+    if proprietaire:
+        registre('sessions').set(('proprietaire', session), proprietaire, expire=duree_session)
+
+def proprietaire_session(session):
+    """
+    Input :
+        session : jeton de la session
+    Output :
+        proprietaire : jeton du propriétaire de l'historique de la session, None si la session n'en a pas ou a expiré
+    """
+    if not isinstance(session, str):
+        return None
+    registre('sessions').touch(('proprietaire', session), expire=duree_session)
+    return registre('sessions').get(('proprietaire', session))
+
+def cle_session(identifiant, session):
+    """
+    Résolution d'un identifiant reçu du navigateur, l'expiration de la session et de ses données est repoussée à chaque interaction
+
+    Input :
+        identifiant : identifiant court du jeu de données
+        session : jeton de la session
+    Output :
+        cle : clé du contenu du jeu de données, None si l'identifiant est inconnu, expiré ou appartient à une autre session
+    """
+    if not isinstance(identifiant, str):
+        return None
+    entree = registre('sessions').get(identifiant)
+    if entree is None or not secrets.compare_digest(str(entree['session']), str(session)):
+        return None
+    registre('sessions').touch(identifiant, expire=duree_session)
+    registre('donnees').touch(entree['cle'], expire=duree_session)
+    return entree['cle']
+
+def donnees_session(identifiant, session):
+    """
+    Input :
+        identifiant : identifiant court du jeu de données
+        session : jeton de la session
+    Output :
+        donnees : jeu de données, None s'il n'est pas accessible à la session
+    """
+    cle = cle_session(identifiant, session)
+    return lecture_donnees(cle) if cle else None
+
+############################ STOCKAGE PERSISTANT ############################
+# Un historique par propriétaire (navigateur identifié par cookie_proprietaire) : une session ne charge
+# et n'enrichit que l'historique de son propriétaire
+# Colonnes des opérations conservées sur disque, les colonnes dérivées sont recalculées au chargement
+colonnes_stockage = colonnes_export + ['Identifiant']
+
+def dossier_proprietaire(proprietaire):
+    """
+    Input :
+        proprietaire : jeton du propriétaire, None pour une session sans historique
+    Output :
+        dossier : dossier de l'historique du propriétaire (empreinte du jeton, le jeton n'est pas écrit sur disque),
+                  None sans propriétaire ou sans stockage
+    """
+    if not dossier_stockage or not proprietaire:
+        return None
+    return os.path.join(dossier_stockage, hashlib.sha256(proprietaire.encode()).hexdigest()[:32])
+
+def parties_stockage(proprietaire):
+    """
+    Input :
+        proprietaire : jeton du propriétaire de l'historique
+    Output :
+        parties : liste des fichiers Arrow de l'historique du propriétaire, dans l'ordre d'écriture
+    """
+    dossier = dossier_proprietaire(proprietaire)
+    if not dossier or not os.path.isdir(dossier):
+        return []
+    return sorted(os.path.join(dossier, f) for f in os.listdir(dossier) if f.endswith('.arrow'))
+
+def ecriture_stockage(df, fichiers, proprietaire):
+    """
+    Ajout d'opérations à l'historique persistant : chaque ajout est écrit dans un nouveau fichier Arrow (IPC),
+    les fichiers existants ne sont jamais réécrits
+
+    Input :
+        df : dataframe des opérations prétraitées ajoutées
+        fichiers : dictionnaire {empreinte du contenu : nom} des fichiers uploadés dont proviennent les opérations
+        proprietaire : jeton du propriétaire de l'historique, None pour ne rien écrire
+    """
+    dossier = dossier_proprietaire(proprietaire)
+    if not dossier or not fichiers:
+        return
+
+    # Types compacts : textes en dictionnaire, date sur 4 octets, montant en réel (euros)
+    df = df[colonnes_stockage].astype({col: 'category' for col in colonnes_dictionnaire}).assign(Montant=df['Montant'].to_numpy()/100)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.set_column(table.schema.get_field_index('Date opération'), 'Date opération', table['Date opération'].cast(pa.date32()))
+    table = table.replace_schema_metadata({**table.schema.metadata, b'fichiers': json.dumps(fichiers).encode()})
+
+    os.makedirs(dossier, exist_ok=True)
+    chemin = os.path.join(dossier, f"{datetime.now():%Y%m%d%H%M%S%f}-{cle_fichiers(fichiers)[:12]}.arrow")
+    with pa.OSFile(chemin+'.tmp', 'wb') as sortie, pa.ipc.new_file(sortie, table.schema) as ecriture:
+        ecriture.write_table(table)
+    # Renommage atomique : un fichier partiellement écrit n'est jamais lu
+    os.replace(chemin+'.tmp', chemin)
+
+def chargement_stockage(proprietaire):
+    """
+    Chargement de l'historique persistant d'un propriétaire, les fichiers Arrow étant projetés en mémoire (memory map)
+    Seul le schéma est lu si le jeu de données de l'historique est déjà en cache
+
+    Input :
+        proprietaire : jeton du propriétaire de l'historique
+    Output :
+        cle : identifiant du jeu de données de l'historique, None si l'historique est vide
+    """
+    parties = parties_stockage(proprietaire)
+    if not parties:
+        return None
+
+    fichiers = {}
+    for partie in parties:
+        fichiers.update(json.loads(pa.ipc.open_file(pa.memory_map(partie)).schema.metadata[b'fichiers']))
+    cle = cle_fichiers(fichiers)
+
+    with _verrou_chargement:
+        if lecture_donnees(cle) is not None:
+            return cle
+        df = pd.concat([pa.ipc.open_file(pa.memory_map(partie)).read_all().to_pandas(date_as_object=False) for partie in parties], axis=0, ignore_index=True)
+        df = df.astype({col: object for col in colonnes_dictionnaire}).astype({'Date opération': 'datetime64[ns]'})
+        # Un même fichier uploadé depuis deux sessions du propriétaire peut avoir été écrit deux fois
+        df = df.drop_duplicates('Identifiant')
+        donnees, taille = construction_donnees(preprocessing(df), fichiers)
+        mise_en_cache(cle, donnees, taille)
+        enregistrement_donnees(cle, donnees)
+    return cle
+
+class GestionnaireTaches(DiskcacheManager):
+    """
+    Les callbacks lourds (chargement des fichiers) s'exécutent dans des processus dont les tâches sont suivies dans le
+    registre 'taches', ouvert à la première tâche et non à la création du gestionnaire (importer app ne crée pas le dossier d'échange)
+    """
+    def __init__(self):
+        self.expire = None
+        BaseLongCallbackManager.__init__(self, None)
+
+    @property
+    def handle(self):
+        return registre('taches')
+
+    def make_job_fn(self, fn, progress, key=None):
+        # DiskcacheManager lie le registre à la fonction de la tâche dès l'enregistrement du callback : liaison reportée à son exécution
+        return lambda *args: DiskcacheManager.make_job_fn(self, fn, progress, key)(*args)
+
+app = Dash(__name__, background_callback_manager=GestionnaireTaches())
 server = app.server
 
+@server.before_request
+def debut_requete():
+    if instrumentation:
+        g.debut_requete = time.perf_counter()
+
+@server.after_request
+def fin_requete(response):
+    """
+    Durée et taille des réponses de callback, et en-tête Server-Timing des étapes mesurées pendant la requête
+    """
+    if not instrumentation or 'debut_requete' not in g:
+        return response
+    duree = time.perf_counter() - g.debut_requete
+    etapes = g.get('etapes', [])
+    if request.path.endswith('_dash-update-component'):
+        # Premier identifiant de sortie du callback ("..table.data...table.columns.." -> table)
+        sortie = re.search(r'[\w-]+', (request.get_json(silent=True) or {}).get('output', ''))
+        nom = 'callback_' + (sortie.group(0) if sortie else 'inconnu')
+        observation('dashboard_reponse_duree_secondes', nom, duree)
+        observation('dashboard_reponse_octets', nom, len(response.get_data()))
+    if etapes:
+        response.headers['Server-Timing'] = ', '.join([f'{nom};dur={d*1000:.1f}' for nom, d in etapes] + [f'total;dur={duree*1000:.1f}'])
+    return response
+
+def proprietaire_requete():
+    """
+    Output :
+        proprietaire : jeton du cookie propriétaire de la requête, nouveau jeton (déposé par depot_cookie_proprietaire)
+                       si le navigateur n'en a pas encore, None hors requête
+    """
+    if not has_request_context():
+        return None
+    proprietaire = request.cookies.get(cookie_proprietaire, '')
+    if not re.fullmatch(r'[\w-]{43}', proprietaire):
+        proprietaire = g.nouveau_proprietaire = secrets.token_urlsafe(32)
+    return proprietaire
+
+@server.after_request
+def depot_cookie_proprietaire(response):
+    if 'nouveau_proprietaire' in g:
+        response.set_cookie(cookie_proprietaire, g.nouveau_proprietaire, max_age=duree_proprietaire,
+                            httponly=True, samesite='Lax', secure=request.is_secure)
+    return response
+
+@server.route('/metrics')
+def metrics():
+    if not instrumentation:
+        abort(404)
+    return Response(format_prometheus(), mimetype='text/plain; version=0.0.4')
+
 colors = {
     'background': '#111111',
     'text': '#7FDBFF'
 }
 
-app.layout = html.Div([
+# Thème commun des figures, appliqué une seule fois : fond et texte du dashboard sur le thème plotly
+pio.templates['dashboard'] = go.layout.Template(layout=dict(
+    plot_bgcolor=colors['background'],
+    paper_bgcolor=colors['background'],
+    font_color=colors['text'],
+))
+pio.templates.default = 'plotly+dashboard'
+
+mise_en_page = html.Div([
     
     html.Div(
         [   
@@ -189,7 +1160,14 @@ app.layout = html.Div([
                 },
                 multiple=True,
             ),
-            html.Ul(id="file-list"),
+            html.Div(
+                [
+                    html.Progress(id="upload-progress", value="0", max="1", style={'display': 'none'}),
+                    html.Span(id="upload-status", style={'marginLeft': '10px'}),
+                ],
+                style={'color': colors['text'], 'margin': '10px'},
+            ),
+            html.Ul(id="file-list", style={'color': colors['text']}),
         ],
         style= {'background': '#111111','text': '#7FDBFF'},
     ),
@@ -199,10 +1177,9 @@ app.layout = html.Div([
         [
             dcc.RangeSlider(
                 0,
-                23,
-                marks=date_mark,
-                step=None,
-                value=[0, 23],
+                mois_affiches-1,
+                step=1,
+                value=[0, mois_affiches-1],
                 id='all_date'
             ),
         ], style= {'background': '#111111','text': '#7FDBFF'}),
@@ -213,8 +1190,14 @@ app.layout = html.Div([
                 id = 'dt1', 
                 columns =  [{"name": i, "id": i,} for i in (['a','b','c','d','e','f'])],   
                 fixed_rows={'headers': True},
-                sort_action='native',
-                filter_action='native',
+                page_action='custom',
+                page_current=0,
+                page_size=taille_page_table,
+                sort_action='custom',
+                sort_mode='multi',
+                sort_by=[],
+                filter_action='custom',
+                filter_query='',
                 style_as_list_view=True,
                 style_header={
                     'backgroundColor': 'rgb(30, 30, 30)',
@@ -324,6 +1307,18 @@ app.layout = html.Div([
         ],style= {'background': '#111111','text': '#7FDBFF'},
     ),
 
+    html.Div(
+        [
+            html.H1("Principaux marchands", style={
+                'textAlign': 'center',
+                'color': colors['text']
+            }),
+
+            dcc.Graph(id="top_marchands", style={'display': 'inline-block', 'width':'48%'}),
+            dcc.Graph(id="marchand", style={'display': 'inline-block', 'width':'48%'}),
+        ],style= {'background': '#111111','text': '#7FDBFF'},
+    ),
+
     html.Div(
         [
             html.H1("Evolution mensuelle de l'épargne", style={
@@ -337,64 +1332,416 @@ app.layout = html.Div([
     
 ],style= {'background': '#111111','text': '#7FDBFF'})
 
+def serve_layout():
+    """
+    Mise en page servie à chaque ouverture du dashboard, pré-chargé avec l'historique persistant du navigateur
+    """
+    # Chaque chargement de la page ouvre une session, propriétaire des jeux de données qu'elle crée
+    session = secrets.token_urlsafe(16)
+    proprietaire = proprietaire_requete()
+    enregistrement_proprietaire(session, proprietaire)
+    cle = chargement_stockage(proprietaire)
+    return html.Div([dcc.Store(id="session", data=session), dcc.Store(id="dataset", data=enregistrement_session(cle, session) if cle else None), mise_en_page], style= {'background': '#111111','text': '#7FDBFF'})
+
+app.layout = serve_layout
+
+########### CHARGEMENT DES FICHIERS ###########
+# Callback en arrière-plan : la lecture, la détection des dépenses récurrentes et la construction du cube
+# n'occupent pas le serveur web. Déposer un nouveau fichier pendant le calcul annule la tâche en cours
+# Les durées de ses étapes sont transmises au serveur web (metriques_transmises) : visibles sur /metrics, pas dans Server-Timing
+@app.callback(
+    Output("dataset", "data"),
+    Input("upload-data", "contents"),
+    State("upload-data", "filename"),
+    State("dataset", "data"),
+    State("session", "data"),
+    background=True,
+    progress=[Output("upload-progress", "value"), Output("upload-progress", "max"), Output("upload-status", "children")],
+    running=[
+        (Output("upload-progress", "style"), {'display': 'inline'}, {'display': 'none'}),
+        (Output("upload-status", "children"), "", ""),
+    ],
+    prevent_initial_call=True,
+)
+def update_dataset(set_progress, contents, filename, dataset, session):
+
+    if not contents:
+        raise PreventUpdate
+
+    nb_etapes = len(contents) + 3
+    compteur = itertools.count()
+
+    # Les fichiers uploadés s'ajoutent au jeu de données de la session et à l'historique de son propriétaire
+    with metriques_transmises():
+        cle = ajout_fichiers(cle_session(dataset, session), contents, filename, lambda texte: set_progress((str(next(compteur)), str(nb_etapes), texte)),
+                             proprietaire_session(session))
+    return enregistrement_session(cle, session)
+
+@app.callback(
+    Output("file-list", "children"),
+    Input("dataset", "data"),
+    State("session", "data"),
+)
+def update_file_list(dataset, session):
+
+    donnees = donnees_session(dataset, session)
+    if not donnees:
+        return []
+    fichiers = [html.Li(nom) for nom in donnees['noms']]
+    fichiers += [html.Li(f"{(donnees['transactions']['Mois'].to_numpy() >= donnees['mois'][0].ordinal).sum()} opérations sur la période analysée")]
+    fichiers += [html.Li(f"Mémoire : {taille_donnees(donnees)/1024**2:.1f} Mo")]
+    return fichiers
+
+########### COLONNES DE LA DATATABLE ###########
+colonnes_table = ['Opération pointée', 'Date opération', 'Libellé opération', 'Catégorie', 'Sous-catégorie','Montant', 'Année-Mois opération']
+
+def plage_axes(df, axe, all_date):
+    """
+    Bornes des axes d'un histogramme mensuel empilé restreint à la période sélectionnée
+
+    Input :
+        df : dataframe des montants (Année-Mois opération, Montant)
+        axe : index mensuel du RangeSlider (pd.PeriodIndex)
+        all_date : liste de la borne inf et sup d'Année Mois (positions sur l'axe)
+
+    Output :
+        xrange : bornes de l'axe des abscisses (mois sélectionnés)
+        yrange : bornes de l'axe des ordonnées (empilement des montants des mois sélectionnés)
+    """
+    debut, fin = bornes_mois(axe, all_date)
+    debut, fin = debut.start_time, fin.start_time
+    xrange = [str(debut-timedelta(days=15)), str(fin+timedelta(days=15))]
+
+    df = df[df['Année-Mois opération'].between(debut, fin)]
+    positif = df['Montant'].clip(lower=0).groupby(df['Année-Mois opération']).sum()
+    negatif = df['Montant'].clip(upper=0).groupby(df['Année-Mois opération']).sum()
+    ymax, ymin = max(positif.max() if len(positif) else 0, 0), min(negatif.min() if len(negatif) else 0, 0)
+    if ymax == ymin:
+        ymax = 1
+    return xrange, [1.05*float(ymin), 1.05*float(ymax)]
+
+@instrumente('patch_plage')
+def patch_plage(df, axe, all_date, categories=None):
+    """
+    Input :
+        df : dataframe des montants (Année-Mois opération, Montant)
+        axe : index mensuel du RangeSlider (pd.PeriodIndex)
+        all_date : liste de la borne inf et sup d'Année Mois (positions sur l'axe)
+        categories : liste des catégories affichées, None pour toutes les catégories
+
+    Output :
+        fig : Patch ne mettant à jour que les bornes des axes de la figure
+    """
+    # Agrégation de toutes les catégories avant la sélection, comme figure_depenses : bornes calculées sur les barres affichées
+    df = agregation_temporelle(df)
+    if categories is not None:
+        df = df[df['Catégorie'].isin(categories)]
+    xrange, yrange = plage_axes(df, axe, all_date)
+    fig = Patch()
+    fig['layout']['xaxis']['range'] = xrange
+    fig['layout']['yaxis']['range'] = yrange
+    return fig
+
+########### CONSTRUCTION DES FIGURES ###########
+def agregation_temporelle(df):
+    """
+    Regroupement des barres mensuelles par trimestre, puis par année, tant que leur nombre dépasse seuil_barres :
+    la taille des histogrammes reste bornée quelle que soit la profondeur de l'historique
+
+    Input :
+        df : dataframe des montants mensuels (Année-Mois opération, Montant, Catégorie et/ou Sous-catégorie)
+    Output :
+        df : dataframe des montants par mois, trimestre ou année (premier jour de la période dans Année-Mois opération)
+    """
+    cles = [col for col in ['Catégorie', 'Sous-catégorie'] if col in df]
+    for frequence in ['Q', 'Y']:
+        if len(df) <= seuil_barres:
+            break
+        periode = df['Année-Mois opération'].dt.to_period(frequence).dt.start_time
+        df = df.groupby([periode]+[df[col] for col in cles], sort=False, dropna=False)['Montant'].sum().reset_index()
+    return df
+
+def statistiques_boites(df):
+    """
+    Statistiques des boîtes à moustaches par Sous-catégorie (quartiles par interpolation linéaire,
+    moustaches au dernier point à moins de 1,5 écart interquartile des quartiles)
+
+    Input :
+        df : dataframe (Sous-catégorie, Montant)
+    Output :
+        stats : dataframe indexé par Sous-catégorie dans l'ordre d'apparition (q1, median, q3, lowerfence, upperfence)
+        aberrants : dataframe des points hors moustaches (Sous-catégorie, Montant), limité aux nb_max_points_aberrants
+                    points les plus éloignés de la médiane par Sous-catégorie
+    """
+    df = df[['Sous-catégorie', 'Montant']].astype({'Sous-catégorie': object, 'Montant': 'float64'}).dropna()
+    if df.empty:
+        return pd.DataFrame([], columns=['q1', 'median', 'q3', 'lowerfence', 'upperfence']), df
+    stats = df.groupby('Sous-catégorie', sort=False)['Montant'].quantile([0.25, 0.5, 0.75]).unstack()
+    stats.columns = ['q1', 'median', 'q3']
+
+    ecart = 1.5*(stats['q3']-stats['q1'])
+    montant = df['Montant'].to_numpy()
+    interieur = (montant >= df['Sous-catégorie'].map(stats['q1']-ecart).to_numpy()) & (montant <= df['Sous-catégorie'].map(stats['q3']+ecart).to_numpy())
+    stats = stats.join(df[interieur].groupby('Sous-catégorie', sort=False)['Montant'].agg(lowerfence='min', upperfence='max'))
+
+    aberrants = df[~interieur]
+    distance = (aberrants['Montant']-aberrants['Sous-catégorie'].map(stats['median'])).abs().to_numpy()
+    aberrants = aberrants.iloc[np.argsort(-distance, kind='stable')]
+    aberrants = aberrants[aberrants.groupby('Sous-catégorie', sort=False).cumcount().to_numpy() < nb_max_points_aberrants]
+    return stats, aberrants
+
+@instrumente('figure_depenses')
+def figure_depenses(df_bar_cost, axe, all_date, categories=None):
+    """
+    Input :
+        df_bar_cost : dataframe des coûts mensuels par Catégorie et Sous-catégorie
+        axe : index mensuel du RangeSlider (pd.PeriodIndex)
+        all_date : liste de la borne inf et sup d'Année Mois (positions sur l'axe)
+        categories : liste des catégories affichées, None pour toutes les catégories
+    Output :
+        fig1 : histogramme empilé des dépenses mensuelles par Sous-catégorie, une trace par Catégorie et Sous-catégorie
+               (meta : Catégorie) : les traces des autres catégories sont envoyées masquées, la sélection des
+               catégories les affiche dans le navigateur (visibilite_categories)
+    """
+    df_bar_cost = agregation_temporelle(df_bar_cost)
+    palette = px.colors.qualitative.Plotly
+    couleurs = {sous_categorie: palette[i % len(palette)] for i, sous_categorie in enumerate(pd.unique(df_bar_cost['Sous-catégorie']))}
+    fig1 = go.Figure()
+    legende = set()
+    for (sous_categorie, categorie), df in df_bar_cost.groupby(['Sous-catégorie', 'Catégorie'], sort=False):
+        # Une Sous-catégorie partagée par plusieurs catégories n'a qu'une entrée de légende, portée par sa première trace affichée
+        visible = categories is None or categorie in categories
+        fig1.add_trace(go.Bar(
+            x=df['Année-Mois opération'], y=df['Montant'], name=sous_categorie, legendgroup=sous_categorie, meta=categorie,
+            marker_color=couleurs[sous_categorie], visible=visible, showlegend=visible and sous_categorie not in legende,
+            hovertemplate=f'Sous-catégorie={sous_categorie}<br>Année-Mois opération=%{{x}}<br>Montant=%{{y}}<extra></extra>',
+        ))
+        if visible:
+            legende.add(sous_categorie)
+    selection = df_bar_cost if categories is None else df_bar_cost[df_bar_cost['Catégorie'].isin(categories)]
+    xrange, yrange = plage_axes(selection, axe, all_date)
+    fig1.update_layout(
+        barmode='stack',
+        xaxis_title='Année-Mois opération',
+        yaxis_title='Montant',
+        legend_title_text='Sous-catégorie',
+        xaxis_range=xrange,
+        yaxis_range=yrange,
+    )
+    return fig1
+
+@instrumente('figure_sunburst')
+def figure_sunburst(df_sunburst):
+    """
+    Input :
+        df_sunburst : dataframe des dépenses et de l'épargne (sunburst_data)
+    Output :
+        fig2 : sunburst des dépenses par Catégorie et Sous-catégorie
+    """
+    fig2 = px.sunburst(df_sunburst, path=['Catégorie', 'Sous-catégorie'] ,values='Montant', title='Dépenses', height=700).update_traces(textinfo="label+percent parent")
+    return fig2
+
+@instrumente('figure_boxplot')
+def figure_boxplot(df_boxplot_epcost):
+    """
+    Input :
+        df_boxplot_epcost : dataframe des dépenses et de l'épargne d'une Catégorie
+    Output :
+        fig3 : boxplot des montants par Sous-catégorie
+    """
+    if not statistiques_boxplot:
+        fig3 = px.box(df_boxplot_epcost, x="Sous-catégorie", y="Montant", title='Boxplot', color='Sous-catégorie', height=700)
+    else:
+        # Seules les statistiques et les points aberrants sont envoyés au navigateur
+        stats, aberrants = statistiques_boites(df_boxplot_epcost)
+        points = dict(tuple(aberrants.groupby('Sous-catégorie', sort=False)['Montant']))
+        nuage = go.Scattergl if len(aberrants) > seuil_webgl else go.Scatter
+        palette = px.colors.qualitative.Plotly
+        fig3 = go.Figure()
+        for i, (sous_categorie, s) in enumerate(stats.iterrows()):
+            fig3.add_trace(go.Box(
+                x=[sous_categorie], q1=[s['q1']], median=[s['median']], q3=[s['q3']],
+                lowerfence=[s['lowerfence']], upperfence=[s['upperfence']],
+                name=sous_categorie, legendgroup=sous_categorie, marker_color=palette[i % len(palette)],
+            ))
+            if sous_categorie in points:
+                fig3.add_trace(nuage(
+                    x=[sous_categorie]*len(points[sous_categorie]), y=points[sous_categorie], mode='markers',
+                    name=sous_categorie, legendgroup=sous_categorie, showlegend=False, marker_color=palette[i % len(palette)],
+                ))
+        fig3.update_layout(title='Boxplot', height=700, xaxis_title='Sous-catégorie', yaxis_title='Montant', legend_title_text='Sous-catégorie')
+    fig3.update_layout(
+        legend=dict(yanchor="top", xanchor='right'),
+    )
+    return fig3
+
+@instrumente('figure_recurrentes')
+def figure_recurrentes(df_bar_costrec, axe, all_date):
+    """
+    Input :
+        df_bar_costrec : dataframe des dépenses récurrentes
+        axe : index mensuel du RangeSlider (pd.PeriodIndex)
+        all_date : liste de la borne inf et sup d'Année Mois (positions sur l'axe)
+    Output :
+        fig5 : histogramme empilé des dépenses récurrentes mensuelles par Sous-catégorie
+    """
+    df_bar_costrec = agregation_temporelle(df_bar_costrec)
+    fig5 = px.bar(df_bar_costrec, x="Année-Mois opération", y="Montant", color='Sous-catégorie', barmode="stack")
+    xrange, yrange = plage_axes(df_bar_costrec, axe, all_date)
+    fig5.update_layout(
+        xaxis_range=xrange,
+        yaxis_range=yrange,
+    )
+    return fig5
+
+@instrumente('figure_epargne')
+def figure_epargne(df_bar_ep, axe, all_date):
+    """
+    Input :
+        df_bar_ep : dataframe de l'épargne mensuelle
+        axe : index mensuel du RangeSlider (pd.PeriodIndex)
+        all_date : liste de la borne inf et sup d'Année Mois (positions sur l'axe)
+    Output :
+        fig4 : histogramme de l'épargne mensuelle
+    """
+    df_bar_ep = agregation_temporelle(df_bar_ep)
+    fig4=px.bar(df_bar_ep, x='Année-Mois opération', y='Montant')
+    #fig4.add_hline(y=df_epgrouped['Montant'].mean(), line_dash="dot", color='red', annotation_text="épargne moyenne", annotation_position="bottom right")
+    xrange, yrange = plage_axes(df_bar_ep, axe, all_date)
+    fig4.update_layout(
+        xaxis_range=xrange,
+        yaxis_range=yrange,
+    )
+    return fig4
+
+@instrumente('figure_marchands')
+def figure_marchands(df_marchands):
+    """
+    Input :
+        df_marchands : dataframe des principaux marchands (top_marchands)
+    Output :
+        fig6 : histogramme horizontal des dépenses par marchand, un clic sur une barre affiche ses opérations
+    """
+    fig6 = px.bar(df_marchands, x='Montant', y='Marchand', orientation='h', hover_data=['Opérations'], title='Dépenses par marchand', height=700)
+    fig6.update_layout(
+        yaxis=dict(autorange='reversed', title=None),
+    )
+    return fig6
+
+@instrumente('figure_operations_marchand')
+def figure_operations_marchand(df_marchand, marchand):
+    """
+    Input :
+        df_marchand : dataframe des opérations d'un marchand (operations_marchand), Montant en centimes
+        marchand : marchand normalisé
+    Output :
+        fig7 : nuage des opérations du marchand (date, montant), libellés d'origine au survol
+    """
+    df_marchand = df_marchand.assign(Montant=df_marchand['Montant'].to_numpy()/100).astype({'Libellé opération': object, 'Sous-catégorie': object})
+    fig7 = px.scatter(df_marchand, x='Date opération', y='Montant', color='Sous-catégorie', hover_data=['Libellé opération'],
+                      title=marchand or 'Opérations du marchand', height=700, render_mode='webgl' if len(df_marchand) > seuil_webgl else 'svg')
+    return fig7
+
+########### FILTRE ET TRI DE LA DATATABLE ###########
+# Opérateurs du langage de filtre de la DataTable : {colonne} opérateur valeur
+operateurs_filtre = {'ge': 'ge', '>=': 'ge', 'le': 'le', '<=': 'le', 'gt': 'gt', '>': 'gt', 'lt': 'lt', '<': 'lt',
+                     'ne': 'ne', '!=': 'ne', 'eq': 'eq', '=': 'eq', 'contains': 'contains', 'datestartswith': 'datestartswith'}
+expression_filtre = re.compile(r"^\s*\{(?P<colonne>[^}]+)\}\s*(?P<casse>[is]?)(?P<operateur>contains|datestartswith|eq|ne|ge|le|gt|lt|>=|<=|!=|=|<|>)\s*(?P<valeur>.*?)\s*$")
+
+@instrumente('masque_filtre')
+def masque_filtre(df, filter_query):
+    """
+    Traduction de la requête de filtre de la DataTable en masque vectorisé
+    Les parties de la requête non reconnues sont ignorées
+
+    Input :
+        df : dataframe affiché dans la DataTable
+        filter_query : requête de filtre de la DataTable ('{Montant} > 10 && {Libellé opération} contains UBER')
+
+    Output :
+        masque : tableau booléen des lignes vérifiant la requête
+    """
+    masque = np.ones(len(df), dtype=bool)
+    for partie in (filter_query or '').split(' && '):
+        expression = expression_filtre.match(partie)
+        if not expression or expression['colonne'] not in df:
+            continue
+        colonne, operateur, valeur = df[expression['colonne']], operateurs_filtre[expression['operateur']], expression['valeur']
+        if len(valeur) > 1 and valeur[0] == valeur[-1] and valeur[0] in '"\'`':
+            valeur = valeur[1:-1].replace('\\'+valeur[0], valeur[0])
+
+        try:
+            if pd.api.types.is_datetime64_any_dtype(colonne):
+                # Date partielle (année, mois ou jour) : comparaison à la période correspondante
+                periode = pd.Period(valeur)
+                if operateur in ['datestartswith', 'contains', 'eq']:
+                    masque &= colonne.between(periode.start_time, periode.end_time).to_numpy()
+                elif operateur == 'ne':
+                    masque &= ~colonne.between(periode.start_time, periode.end_time).to_numpy()
+                elif operateur in ['ge', 'lt']:
+                    masque &= getattr(colonne, operateur)(periode.start_time).to_numpy()
+                else:
+                    masque &= getattr(colonne, operateur)(periode.end_time).to_numpy()
+            elif pd.api.types.is_numeric_dtype(colonne) and operateur not in ['contains', 'datestartswith']:
+                masque &= getattr(colonne, operateur)(float(valeur)).to_numpy()
+            else:
+                texte = colonne.astype(str)
+                if expression['casse'] == 'i':
+                    texte, valeur = texte.str.lower(), valeur.lower()
+                if operateur == 'contains':
+                    masque &= texte.str.contains(valeur, regex=False).to_numpy()
+                elif operateur == 'datestartswith':
+                    masque &= texte.str.startswith(valeur).to_numpy()
+                else:
+                    masque &= getattr(texte, operateur)(valeur).to_numpy()
+        except ValueError:
+            continue
+    return masque
+
+########### AXE DES MOIS DU RANGESLIDER ###########
+@app.callback(
+    Output("all_date", "min"),
+    Output("all_date", "max"),
+    Output("all_date", "marks"),
+    Output("all_date", "value"),
+    Input("dataset", "data"),
+    State("session", "data"),
+)
+def update_axe_mois(dataset, session):
+
+    donnees = donnees_session(dataset, session)
+    axe = donnees['mois'] if donnees else axe_mois()
+    return 0, len(axe)-1, marques_mois(axe), [max(0, len(axe)-mois_affiches), len(axe)-1]
+
+########### DATATABLE SELECTION DES DONNES ###########
 @app.callback(
     Output("dt1", "data"),
     Output("dt1","columns"),
-    Output("graph", "figure"), 
-    Output("sunburst_grouped","figure"),
-    Output("boxplot", "figure"),
-    Output('costrec', 'figure'),
-    Output("epargne", "figure"),
-    [Input("upload-data", "contents"), Input("upload-data", "filename")],
+    Output("dt1", "page_count"),
+    Output("dt1", "page_current"),
+    Input("dataset", "data"),
     Input("all_category", "value"),
     Input("all_date", "value"),
-    Input("category", "value"),
+    Input("dt1", "page_current"),
+    Input("dt1", "page_size"),
+    Input("dt1", "sort_by"),
+    Input("dt1", "filter_query"),
+    State("session", "data"),
 )
+def update_table(dataset, all_category, all_date, page_current, page_size, sort_by, filter_query, session):
 
-def update_bar_chart(contents, filename, all_category, all_date, category):
-
-    df_bar_cost = pd.DataFrame([],columns=['Catégorie', "Sous-catégorie", 'Montant', 'Année-Mois opération'])
-    df_sunburst = pd.DataFrame([],columns=['Catégorie', "Sous-catégorie", 'Montant', 'Année-Mois opération']) 
-    df_boxplot_epcost = pd.DataFrame([],columns=['Catégorie', "Sous-catégorie", 'Montant', 'Année-Mois opération'])
-    df_bar_ep = pd.DataFrame([],columns=['Catégorie', "Sous-catégorie", 'Montant', 'Année-Mois opération'])
     df_selec_table = pd.DataFrame(np.array([[0,0,0,0,0,0,0],[0,0,0,0,0,0,0],[0,0,0,0,0,0,0],[0,0,0,0,0,0,0]]),columns=["Libellé opération", 'Catégorie', "Sous-catégorie", 'Montant', 'Date opération',"Opération pointée", 'Année-Mois opération'])
-    df_bar_costrec = pd.DataFrame([],columns=['Catégorie', "Sous-catégorie", 'Montant', 'Année-Mois opération'])
 
-    if contents:
-        contents = contents[0]
-        filename = filename[0]
-        df = parse_data(contents, filename)  # decoding file
-        df_courant = preprocessing(df,24) # selecting period 
-        df_ep, df_cost, df_income, df_epcost = sep_cost_income_ep(df_courant) # create different dataframe
-        
-        ########### HISTOGRAMM DES DEPENSES MENSUELLES SELECTION CATEGORIE ET SOUS-CATEGORIE ###########
-        if 'All' in all_category :
-            df_selec=df_cost
-            df_selec_table=df_epcost
-        else :
-            df_selec=df_cost[df_cost['Catégorie'].isin(all_category)]
-            df_selec_table=df_epcost[df_epcost['Catégorie'].isin(all_category)]
-
-        df_costrec=depense_recurrente(df_cost)
-        df_cost, df_epcost, df_ep, df_income, df_costrec = data_conversion(df_cost, df_epcost, df_ep, df_income, df_costrec, date_mark, all_date) # converting datetime
-        df_sunburst = sunburst_data(df_ep, df_cost)    
-
-        df_bar_cost=df_selec.groupby(['Catégorie','Sous-catégorie','Année-Mois opération']).sum('Montant').reset_index()
-        
-        df_sunburst=df_sunburst[df_sunburst['Année-Mois opération'].between(pd.to_datetime(date_mark[all_date[0]]),pd.to_datetime(date_mark[all_date[1]]))]
-
-        df_boxplot_epcost=df_epcost[df_epcost['Catégorie']==category]
-        
-        
-        df_bar_costrec=df_costrec[df_costrec['Année-Mois opération'].between(pd.to_datetime(date_mark[all_date[0]]),pd.to_datetime(date_mark[all_date[1]]))]
-        
-
-        df_bar_ep=df_ep.groupby('Année-Mois opération').sum('Montant').reset_index()
-        df_bar_ep['Catégorie']=["Epargne consommée" if s<0 else "Epargne acquise" for s in df_bar_ep['Montant']]   
-
-        ########### DATATABLE SELECTION DES DONNES ###########
+    donnees = donnees_session(dataset, session)
+    if donnees:
+        transactions=donnees['transactions']
+        masque=sep_cost_income_ep(transactions)[3]
+        if 'All' not in all_category :
+            masque&=transactions['Catégorie'].isin(all_category).to_numpy()
+        df_selec_table=vue_flux(transactions, masque)
+
         cols=[]
-        for col in [ 'Opération pointée', 'Date opération', 'Libellé opération', 'Catégorie', 'Sous-catégorie','Montant', 'Année-Mois opération']:
+        for col in colonnes_table:
             if col=='Montant':
                 cols+=[{'name': col, 'id': col, 'type':'numeric', 'format':dash_table.Format.Format(
                     scheme=dash_table.Format.Scheme.fixed, 
@@ -409,61 +1756,178 @@ def update_bar_chart(contents, filename, all_category, all_date, category):
                 cols+=[{'name': col, 'id': col, 'type':'datetime'}]
             else:
                 cols+=[{'name': col, 'id': col}]
+        df_selec_table=data_conversion(df_selec_table, donnees['mois'], all_date)
     else:
-        cols=[{'name': col, 'id': col} for col in (['Opération pointée', 'Date opération', 'Libellé opération', 'Catégorie', 'Sous-catégorie','Montant', 'Année-Mois opération'])]
-
-    df_selec_table['Année-Mois opération']=pd.to_datetime(df_selec_table['Année-Mois opération'])
-    df_selec_table=df_selec_table[df_selec_table['Année-Mois opération'].between(pd.to_datetime(date_mark[all_date[0]]),pd.to_datetime(date_mark[all_date[1]]))]
+        cols=[{'name': col, 'id': col} for col in colonnes_table]
+        df_selec_table=df_selec_table.iloc[0:0]
     df_selec_table=df_selec_table[[ 'Opération pointée', 'Date opération', 'Libellé opération', 'Catégorie', 'Sous-catégorie','Montant']]
-    data=df_selec_table.to_dict('records')
-    
-    
-    ###########
-    fig1 = px.bar(df_bar_cost, x="Année-Mois opération", y="Montant", color='Sous-catégorie', barmode="stack")
-    
-    ########### SUNBURST DES DEPENSES SUR UNE PERIODE DONNEES : CATEGORIE ET SOUS-CATEGORIE ###########
-    fig2 = px.sunburst(df_sunburst, path=['Catégorie', 'Sous-catégorie'] ,values='Montant', title='Dépenses', height=700).update_traces(textinfo="label+percent parent")
 
-    ########### BOXPLOT DES DEPENSES PAR CATEGORIES ET SOUS-CATEGORIE ###########
-    fig3 = px.box(df_boxplot_epcost, x="Sous-catégorie", y="Montant", title='Boxplot', color='Sous-catégorie', height=700)
-    
-    fig5 = px.bar(df_bar_costrec, x="Année-Mois opération", y="Montant", color='Sous-catégorie', barmode="stack")
-    ########### DONNES EPARGNES ###########
-    fig4=px.bar(df_bar_ep, x='Année-Mois opération', y='Montant')
-    #fig4.add_hline(y=df_epgrouped['Montant'].mean(), line_dash="dot", color='red', annotation_text="épargne moyenne", annotation_position="bottom right")
+    # Filtre, tri et pagination côté serveur : seule la page affichée est envoyée au navigateur
+    df_selec_table=df_selec_table[masque_filtre(df_selec_table, filter_query)]
+    sort_by=[tri for tri in sort_by or [] if tri['column_id'] in df_selec_table]
+    if sort_by:
+        df_selec_table=df_selec_table.sort_values(
+            [tri['column_id'] for tri in sort_by],
+            ascending=[tri['direction']=='asc' for tri in sort_by],
+            kind='stable',
+        )
+    page_count=max(1, -(-len(df_selec_table)//page_size))
+    # Nouvelle sélection, filtre ou tri : retour à la première page, la page demandée reste dans les pages existantes
+    if 'dt1.page_current' not in ctx.triggered_prop_ids:
+        page_current=0
+    page_current=min(page_current or 0, page_count-1)
+    page=df_selec_table.iloc[page_current*page_size:(page_current+1)*page_size]
+    return page.to_dict('records'), cols, page_count, page_current
 
-    fig1.update_layout(
-        plot_bgcolor=colors['background'],
-        paper_bgcolor=colors['background'],
-        font_color=colors['text']
-    )
-    
-    fig2.update_layout(
-        plot_bgcolor=colors['background'],
-        paper_bgcolor=colors['background'],
-        font_color=colors['text']
-    )
+########### HISTOGRAMM DES DEPENSES MENSUELLES SELECTION CATEGORIE ET SOUS-CATEGORIE ###########
+# Toutes les catégories sont envoyées : changer la sélection des catégories ne sollicite pas le serveur
+@app.callback(
+    Output("graph", "figure"),
+    Input("dataset", "data"),
+    Input("all_date", "value"),
+    State("all_category", "value"),
+    State("session", "data"),
+)
+def update_bar_chart(dataset, all_date, all_category, session):
 
-    fig3.update_layout(
-        plot_bgcolor=colors['background'],
-        paper_bgcolor=colors['background'],
-        font_color=colors['text'],
-        legend=dict(yanchor="top", xanchor='right'),
-    )
+    df_bar_cost = pd.DataFrame([],columns=['Catégorie', "Sous-catégorie", 'Montant', 'Année-Mois opération'])
+    categories = None if 'All' in all_category else all_category
 
-    fig4.update_layout(
-        plot_bgcolor=colors['background'],
-        paper_bgcolor=colors['background'],
-        font_color=colors['text']
-    )
+    with etape('lecture_donnees'):
+        donnees = donnees_session(dataset, session)
+    if donnees:
+        df_bar_cost=selection_cube(donnees['cube'], 'cost')
 
-    fig5.update_layout(
-        plot_bgcolor=colors['background'],
-        paper_bgcolor=colors['background'],
-        font_color=colors['text']
-    )
- 
-    return data, cols, fig1, fig2, fig3, fig5, fig4
+        # Seule la période change : mise à jour partielle des axes, bornés sur les catégories affichées
+        if ctx.triggered_id == 'all_date':
+            return patch_plage(df_bar_cost, donnees['mois'], all_date, categories)
+    elif ctx.triggered_id == 'all_date':
+        raise PreventUpdate
+
+    return figure_depenses(df_bar_cost, donnees['mois'] if donnees else axe_mois(), all_date, categories)
+
+# Sélection des catégories dans le navigateur (assets/dashboard.js) : visibilité des traces et bornes de l'axe des ordonnées
+clientside_callback(
+    ClientsideFunction(namespace='dashboard', function_name='visibilite_categories'),
+    Output("graph", "figure", allow_duplicate=True),
+    Input("all_category", "value"),
+    State("graph", "figure"),
+    prevent_initial_call=True,
+)
+
+########### SUNBURST DES DEPENSES SUR UNE PERIODE DONNEES : CATEGORIE ET SOUS-CATEGORIE ###########
+@app.callback(
+    Output("sunburst_grouped","figure"),
+    Input("dataset", "data"),
+    Input("all_date", "value"),
+    State("session", "data"),
+)
+def update_sunburst(dataset, all_date, session):
+
+    df_sunburst = pd.DataFrame([],columns=['Catégorie', "Sous-catégorie", 'Montant', 'Année-Mois opération']) 
+
+    donnees = donnees_session(dataset, session)
+    if donnees:
+        df_ep = selection_cube(donnees['cube'], 'ep', donnees['mois'], all_date)
+        df_cost = selection_cube(donnees['cube'], 'cost', donnees['mois'], all_date)
+        df_sunburst = sunburst_data(df_ep, df_cost)
+
+    return figure_sunburst(df_sunburst)
+
+########### BOXPLOT DES DEPENSES PAR CATEGORIES ET SOUS-CATEGORIE ###########
+@app.callback(
+    Output("boxplot", "figure"),
+    Input("dataset", "data"),
+    Input("category", "value"),
+    State("session", "data"),
+)
+def update_boxplot(dataset, category, session):
+
+    df_boxplot_epcost = pd.DataFrame([],columns=['Catégorie', "Sous-catégorie", 'Montant', 'Année-Mois opération'])
+
+    donnees = donnees_session(dataset, session)
+    if donnees:
+        transactions=donnees['transactions']
+        df_boxplot_epcost=vue_flux(transactions, sep_cost_income_ep(transactions)[3] & (transactions['Catégorie']==category).to_numpy())
+
+    return figure_boxplot(df_boxplot_epcost)
+
+########### DEPENSES RECURRENTES ###########
+@app.callback(
+    Output('costrec', 'figure'),
+    Input("dataset", "data"),
+    Input("all_date", "value"),
+    State("session", "data"),
+)
+def update_costrec(dataset, all_date, session):
+
+    df_bar_costrec = pd.DataFrame([],columns=['Catégorie', "Sous-catégorie", 'Montant', 'Année-Mois opération'])
+
+    donnees = donnees_session(dataset, session)
+    if donnees:
+        df_bar_costrec = donnees['costrec']
+        if ctx.triggered_id == 'all_date':
+            return patch_plage(df_bar_costrec, donnees['mois'], all_date)
+    elif ctx.triggered_id == 'all_date':
+        raise PreventUpdate
+
+    return figure_recurrentes(df_bar_costrec, donnees['mois'] if donnees else axe_mois(), all_date)
+
+########### PRINCIPAUX MARCHANDS ###########
+@app.callback(
+    Output("top_marchands", "figure"),
+    Input("dataset", "data"),
+    Input("all_date", "value"),
+    State("session", "data"),
+)
+def update_top_marchands(dataset, all_date, session):
+
+    df_marchands = pd.DataFrame([],columns=['Marchand', 'Montant', 'Opérations'])
+
+    donnees = donnees_session(dataset, session)
+    if donnees:
+        df_marchands = top_marchands(donnees['transactions'], donnees['mois'], all_date)
+
+    return figure_marchands(df_marchands)
+
+########### OPERATIONS D'UN MARCHAND ###########
+@app.callback(
+    Output("marchand", "figure"),
+    Input("dataset", "data"),
+    Input("top_marchands", "clickData"),
+    State("session", "data"),
+)
+def update_marchand(dataset, clickData, session):
+
+    donnees = donnees_session(dataset, session)
+    marchand = clickData['points'][0]['y'] if clickData else None
+    if donnees and marchand:
+        df_marchand = operations_marchand(donnees, marchand)
+    else:
+        df_marchand = pd.DataFrame([],columns=['Date opération', 'Libellé opération', 'Sous-catégorie', 'Montant'])
+
+    return figure_operations_marchand(df_marchand, marchand)
+
+########### DONNES EPARGNES ###########
+@app.callback(
+    Output("epargne", "figure"),
+    Input("dataset", "data"),
+    Input("all_date", "value"),
+    State("session", "data"),
+)
+def update_epargne(dataset, all_date, session):
+
+    df_bar_ep = pd.DataFrame([],columns=['Catégorie', "Sous-catégorie", 'Montant', 'Année-Mois opération'])
+
+    donnees = donnees_session(dataset, session)
+    if donnees:
+        df_bar_ep=epargne_mensuelle(donnees['cube'])
+        if ctx.triggered_id == 'all_date':
+            return patch_plage(df_bar_ep, donnees['mois'], all_date)
+    elif ctx.triggered_id == 'all_date':
+        raise PreventUpdate
+
+    return figure_epargne(df_bar_ep, donnees['mois'] if donnees else axe_mois(), all_date)
 
     
 if __name__ == '__main__':
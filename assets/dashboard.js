@@ -0,0 +1,60 @@
+// Fonctions des callbacks exécutés dans le navigateur (clientside_callback de app.py) : aucun appel au serveur
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    dashboard: {
+        /*
+        Sélection des catégories de l'histogramme des dépenses mensuelles (figure_depenses)
+
+        Input :
+            categories : catégories sélectionnées ('All' pour toutes)
+            figure : figure affichée, une trace par Catégorie (meta) et Sous-catégorie (legendgroup)
+
+        Output :
+            figure : traces des catégories sélectionnées visibles, une entrée de légende par Sous-catégorie affichée,
+                     bornes de l'axe des ordonnées calculées comme plage_axes sur les mois affichés
+        */
+        visibilite_categories: function(categories, figure) {
+            if (!figure || !figure.layout.xaxis || !figure.layout.xaxis.range) {
+                return window.dash_clientside.no_update;
+            }
+            const toutes = !categories || categories.includes('All');
+            const date = x => Date.parse(String(x).replace(' ', 'T'));
+            const [debut, fin] = figure.layout.xaxis.range.map(date);
+
+            // Empilement des montants positifs et négatifs par mois affiché
+            const positif = {};
+            const negatif = {};
+            const legende = new Set();
+            const data = figure.data.map(trace => {
+                const visible = toutes || categories.includes(trace.meta);
+                if (visible) {
+                    trace.x.forEach((x, i) => {
+                        const t = date(x);
+                        if (t < debut || t > fin) {
+                            return;
+                        }
+                        const montant = trace.y[i];
+                        if (montant > 0) {
+                            positif[t] = (positif[t] || 0) + montant;
+                        } else {
+                            negatif[t] = (negatif[t] || 0) + montant;
+                        }
+                    });
+                }
+                const showlegend = visible && !legende.has(trace.legendgroup);
+                if (visible) {
+                    legende.add(trace.legendgroup);
+                }
+                return Object.assign({}, trace, {visible: visible, showlegend: showlegend});
+            });
+
+            let ymax = Object.values(positif).reduce((a, b) => Math.max(a, b), 0);
+            const ymin = Object.values(negatif).reduce((a, b) => Math.min(a, b), 0);
+            if (ymax === ymin) {
+                ymax = 1;
+            }
+            const yaxis = Object.assign({}, figure.layout.yaxis, {range: [1.05*ymin, 1.05*ymax]});
+            return Object.assign({}, figure, {data: data, layout: Object.assign({}, figure.layout, {yaxis: yaxis})});
+        }
+    }
+});
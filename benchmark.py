@@ -0,0 +1,210 @@
+'''@author : Aloyse PHULPIN'''
+
+import argparse
+import base64
+import json
+import platform
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import plotly
+
+import app
+
+############################ DEFINITION DES PARAMETRES ############################
+# Colonnes de l'export bancaire, dans l'ordre du fichier
+colonnes_fichier = ['Banque', 'Libellé Compte', 'RIB', 'Type carte', 'Porteur', 'N° carte', 'Date opération',
+                    'Date prise en compte', 'Libellé opération', 'Note personnelle', 'Type opération', 'Catégorie',
+                    'Sous-catégorie', 'Montant', 'Devise', 'Opération pointée', 'Tags associés']
+# Dépenses par carte : (Catégorie, Sous-catégorie, commerçants, montant moyen)
+depenses_carte = [
+    ('Alimentation', 'Supermarché', ['CARREFOUR MARKET', 'LIDL', 'MONOPRIX', 'INTERMARCHE'], 45),
+    ('Alimentation', 'Snacks / repas au travail', ['HELP.UBER.COM UBER *EATS', 'BOULANGERIE PAUL', 'SUSHI SHOP'], 14),
+    ('Loisirs', 'Sorties', ['UGC CINE CITE', 'FNAC', 'BAR LE CENTRAL'], 25),
+    ('Vie quotidienne', 'Shopping', ['ZARA', 'DECATHLON', 'AMAZON PAYMENTS'], 40),
+    ('Santé', 'Médecin', ['PARIS DOCTOLIB', 'PHARMACIE DU CENTRE'], 25),
+    ('Véhicule', 'Carburant', ['TOTAL ENERGIES', 'ESSO'], 60),
+    ('Vacances / weekend', 'Transport', ['SNCF INTERNET', 'AIR FRANCE'], 120),
+    ('Numérique', 'Matériel', ['APPLE.COM/BILL', 'LDLC'], 80),
+]
+# Opérations mensuelles : (libellé, Type opération, Catégorie, Sous-catégorie, montant, dérive en euros)
+operations_mensuelles = [
+    ('PRLV SEPA LOYER', 'Dépense', 'Logement / maison', 'Loyer', -650.00, 0),
+    ('PRLV SEPA NETFLIX', 'Dépense', 'Loisirs', 'Streaming', -13.49, 0),
+    ('PRLV SEPA EDF', 'Dépense', 'Logement / maison', 'Electricité', -62.00, 0.05),
+    ('PRLV SEPA BOUYGUES TELECOM', 'Dépense', 'Numérique', 'Téléphone', -19.99, 0),
+    ('VIR SALAIRE', 'Recette', 'Revenus professionnels', 'Salaire', 2100.00, 0),
+    ('VIR LIVRET A', 'Hors budget', 'Epargne', 'Livret A', -200.00, 0),
+]
+
+def generation_export(nb_lignes, nb_annees=10, graine=0):
+    """
+    Génération d'un export bancaire synthétique au format du dashboard (17 colonnes, séparateur ';',
+    décimale ',', BOM, fins de ligne CRLF), avec des opérations mensuelles récurrentes
+
+    Input :
+        nb_lignes : nombre d'opérations
+        nb_annees : profondeur de l'historique en années
+        graine : graine du générateur aléatoire
+
+    Output :
+        contenu : octets du fichier csv
+    """
+    rng = np.random.default_rng(graine)
+    fin = pd.Timestamp.today().normalize()
+    mois = pd.period_range(end=fin.to_period('M'), periods=12*nb_annees, freq='M')
+
+    # Opérations mensuelles : une par mois et par opération, dans la limite de nb_lignes
+    nb_mensuelles = min(nb_lignes, len(mois)*len(operations_mensuelles))
+    indice = np.arange(nb_mensuelles)
+    modele = pd.DataFrame(operations_mensuelles, columns=['Libellé opération', 'Type opération', 'Catégorie', 'Sous-catégorie', 'Montant', 'Dérive']).iloc[indice % len(operations_mensuelles)]
+    # Jour tiré dans le mois, sans dépasser la date du jour pour le mois en cours
+    debut_mois = mois[indice // len(operations_mensuelles)].start_time
+    jour = pd.to_timedelta(rng.integers(0, np.minimum(28, (fin-debut_mois).days+1)), unit='D')
+    mensuelles = modele.assign(
+        **{'Date opération': debut_mois + jour},
+        Montant=modele['Montant'].to_numpy() + rng.uniform(-1, 1, nb_mensuelles)*modele['Dérive'].to_numpy(),
+    ).drop(columns='Dérive')
+
+    # Dépenses par carte sur le reste des lignes
+    nb_carte = nb_lignes - nb_mensuelles
+    depense = rng.integers(0, len(depenses_carte), nb_carte)
+    commercants = pd.DataFrame([(c, s, m) for c, s, ms, _ in depenses_carte for m in ms], columns=['Catégorie', 'Sous-catégorie', 'Commerçant'])
+    debut_commercants = np.cumsum([0]+[len(ms) for _, _, ms, _ in depenses_carte])
+    choix = commercants.iloc[debut_commercants[depense] + (rng.random(nb_carte)*np.diff(debut_commercants)[depense]).astype(int)]
+    date = mois[0].start_time + pd.to_timedelta(rng.integers(0, (fin-mois[0].start_time).days+1, nb_carte), unit='D')
+    carte = pd.DataFrame({
+        'Date opération': date,
+        'Libellé opération': 'PAIEMENT CB ' + date.strftime('%d%m') + ' ' + choix['Commerçant'].to_numpy() + ' CARTE 8720',
+        'Type opération': 'Dépense',
+        'Catégorie': choix['Catégorie'].to_numpy(),
+        'Sous-catégorie': choix['Sous-catégorie'].to_numpy(),
+        'Montant': -np.round(rng.gamma(2, np.array([m for *_, m in depenses_carte])[depense]/2), 2),
+    })
+
+    df = pd.concat([mensuelles, carte], axis=0, ignore_index=True).sort_values('Date opération', ascending=False, kind='stable')
+    df['Montant'] = df['Montant'].round(2)
+    df['Date prise en compte'] = df['Date opération'].dt.strftime('%d/%m/%Y')
+    df['Date opération'] = df['Date prise en compte']
+    df = df.assign(**{'Banque': 'Crédit Mutuel', 'Libellé Compte': 'C/C EUROCOMPTE', 'RIB': '10278 040XX XXXXXXXX503',
+                      'Type carte': '', 'Porteur': '', 'N° carte': '', 'Note personnelle': '', 'Devise': 'EUR',
+                      'Opération pointée': 'X', 'Tags associés': ''})[colonnes_fichier]
+    return ('\ufeff' + df.to_csv(sep=';', decimal=',', index=False, lineterminator='\r\n')).encode('utf-8')
+
+def mesure(fonction, memoire=True):
+    """
+    Input :
+        fonction : fonction sans argument de l'étape à mesurer
+        memoire : mesure du pic mémoire (seconde exécution sous tracemalloc, qui ralentit le code Python)
+
+    Output :
+        resultat : résultat de la première exécution
+        mesures : dictionnaire {'duree_s', 'pic_memoire_octets'}
+    """
+    debut = time.perf_counter()
+    resultat = fonction()
+    mesures = {'duree_s': time.perf_counter() - debut}
+    if memoire:
+        tracemalloc.start()
+        fonction()
+        mesures['pic_memoire_octets'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return resultat, mesures
+
+def benchmark(nb_lignes, nb_annees=10, memoire=True):
+    """
+    Mesure de chaque étape du dashboard sur un export synthétique
+
+    Input :
+        nb_lignes : nombre d'opérations de l'export
+        nb_annees : profondeur de l'historique en années
+        memoire : mesure du pic mémoire de chaque étape
+
+    Output :
+        resultat : dictionnaire {'lignes', 'annees', 'taille_fichier_octets', 'etapes' : {étape : mesures}}
+    """
+    contenu = generation_export(nb_lignes, nb_annees)
+    contents = 'data:text/csv;base64,' + base64.b64encode(contenu).decode()
+    all_date = [0, 12*nb_annees-1]
+    etapes = {}
+
+    df, etapes['parse_data'] = mesure(lambda: app.parse_data(contents, 'benchmark.csv'), memoire)
+    df_courant, etapes['preprocessing'] = mesure(lambda: app.preprocessing(df.copy()), memoire)
+    (m_e, m_c, m_i, m_ec), etapes['sep_cost_income_ep'] = mesure(lambda: app.sep_cost_income_ep(df_courant), memoire)
+    df_cost = app.vue_flux(df_courant, m_c)
+    df_costrec, etapes['depense_recurrente'] = mesure(lambda: app.depense_recurrente(df_cost, app.tolerance_recurrence, app.libelle_recurrence), memoire)
+    cube, etapes['cube_mensuel'] = mesure(lambda: app.cube_mensuel(app.vue_flux(df_courant, m_e), df_cost, app.vue_flux(df_courant, m_i, 1)), memoire)
+    axe = app.axe_mois(df_courant)
+    df_table, etapes['data_conversion'] = mesure(lambda: app.data_conversion(app.vue_flux(df_courant, m_ec), axe, all_date), memoire)
+    df_marchands, etapes['top_marchands'] = mesure(lambda: app.top_marchands(df_courant, axe, all_date), memoire)
+    df_sunburst, etapes['sunburst_data'] = mesure(lambda: app.sunburst_data(app.selection_cube(cube, 'ep', axe, all_date), app.selection_cube(cube, 'cost', axe, all_date)), memoire)
+
+    def figures():
+        return [
+            app.figure_depenses(app.selection_cube(cube, 'cost'), axe, all_date),
+            app.figure_sunburst(df_sunburst),
+            app.figure_boxplot(app.vue_flux(df_courant, m_ec & (df_courant['Catégorie'] == 'Alimentation').to_numpy())),
+            app.figure_recurrentes(df_costrec, axe, all_date),
+            app.figure_epargne(app.epargne_mensuelle(cube), axe, all_date),
+            app.figure_marchands(df_marchands),
+        ]
+    figs, etapes['figures'] = mesure(figures, memoire)
+    json_figures, etapes['serialisation_figures'] = mesure(lambda: [json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder) for fig in figs], memoire)
+    records, etapes['to_dict_records'] = mesure(lambda: df_table[app.colonnes_table[:-1]].to_dict('records'), memoire)
+    json_records, etapes['serialisation_records'] = mesure(lambda: json.dumps(records, cls=plotly.utils.PlotlyJSONEncoder), memoire)
+
+    etapes['serialisation_figures']['taille_octets'] = sum(len(f) for f in json_figures)
+    etapes['serialisation_records']['taille_octets'] = len(json_records)
+    return {'lignes': nb_lignes, 'annees': nb_annees, 'taille_fichier_octets': len(contenu), 'etapes': etapes}
+
+def comparaison(resultats, reference):
+    """
+    Input :
+        resultats : résultats du benchmark courant
+        reference : résultats d'un benchmark précédent
+    Output :
+        lignes : lignes de texte du rapport de comparaison (rapport de durée courant / référence)
+    """
+    lignes = []
+    anciens = {r['lignes']: r['etapes'] for r in reference['resultats']}
+    for r in resultats['resultats']:
+        if r['lignes'] not in anciens:
+            continue
+        for etape, mesures in r['etapes'].items():
+            if etape in anciens[r['lignes']]:
+                ratio = mesures['duree_s'] / max(anciens[r['lignes']][etape]['duree_s'], 1e-9)
+                lignes.append(f"{r['lignes']:>10} {etape:<24} {mesures['duree_s']:>9.4f} s  x{ratio:.2f}")
+    return lignes
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark des étapes du dashboard sur des exports bancaires synthétiques")
+    parser.add_argument('--lignes', type=int, nargs='+', default=[10_000, 100_000], help="tailles des exports générés (nombre d'opérations)")
+    parser.add_argument('--annees', type=int, default=10, help="profondeur de l'historique en années")
+    parser.add_argument('--sans-memoire', action='store_true', help="ne pas mesurer le pic mémoire (divise le temps du benchmark par deux)")
+    parser.add_argument('--sortie', default='benchmark_resultats.json', help="fichier JSON des résultats")
+    parser.add_argument('--reference', help="fichier JSON d'un benchmark précédent à comparer")
+    args = parser.parse_args()
+
+    resultats = {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'resultats': [],
+    }
+    for nb_lignes in args.lignes:
+        resultat = benchmark(nb_lignes, args.annees, not args.sans_memoire)
+        resultats['resultats'].append(resultat)
+        for etape, mesures in resultat['etapes'].items():
+            pic = f"{mesures['pic_memoire_octets']/2**20:>9.1f} Mo" if 'pic_memoire_octets' in mesures else ''
+            print(f"{nb_lignes:>10} {etape:<24} {mesures['duree_s']:>9.4f} s {pic}")
+
+    with open(args.sortie, 'w') as f:
+        json.dump(resultats, f, indent=2)
+
+    if args.reference:
+        with open(args.reference) as f:
+            print('\n'.join(comparaison(resultats, json.load(f))))
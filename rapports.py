@@ -0,0 +1,126 @@
+'''@author : Aloyse PHULPIN'''
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import app
+
+############################ DEFINITION DES PARAMETRES ############################
+# Agrégats écrits pour chaque compte : nom du fichier -> fonction (donnees -> dataframe)
+agregats = {
+    'cube': lambda d: d['cube'],
+    'depenses_recurrentes': lambda d: d['costrec'],
+    'sunburst': lambda d: d['sunburst'],
+    'epargne': lambda d: d['epargne'],
+    'marchands': lambda d: app.top_marchands(d['transactions'], d['mois'], [0, len(d['mois'])-1]),
+}
+# Figures écrites pour chaque compte : nom du fichier html -> fonction (donnees -> figure)
+figures = {
+    'depenses': lambda d: app.figure_depenses(app.selection_cube(d['cube'], 'cost'), d['mois'], [0, len(d['mois'])-1]),
+    'sunburst': lambda d: app.figure_sunburst(d['sunburst']),
+    'recurrentes': lambda d: app.figure_recurrentes(d['costrec'], d['mois'], [0, len(d['mois'])-1]),
+    'epargne': lambda d: app.figure_epargne(d['epargne'], d['mois'], [0, len(d['mois'])-1]),
+    'marchands': lambda d: app.figure_marchands(app.top_marchands(d['transactions'], d['mois'], [0, len(d['mois'])-1])),
+}
+
+def limite_memoire(memoire_max):
+    """
+    Initialisation des processus : limite de l'espace d'adressage (Unix), une opération qui la dépasse lève MemoryError
+
+    Input :
+        memoire_max : limite en Mo, None pour ne pas limiter
+    """
+    if memoire_max:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (memoire_max * 1024**2, memoire_max * 1024**2))
+
+def analyse_compte(chemin):
+    """
+    Input :
+        chemin : chemin de l'export csv d'un compte
+
+    Output :
+        donnees : jeu de données du compte construit comme pour le dashboard (construction_donnees),
+                  complété des agrégats 'sunburst' et 'epargne' sur toute la période
+    """
+    df = app.preparation_operations(app.lecture_csv(chemin)).drop_duplicates('Identifiant')
+    donnees, taille = app.construction_donnees(df, {os.path.abspath(chemin): os.path.basename(chemin)})
+    donnees['sunburst'] = app.sunburst_data(app.selection_cube(donnees['cube'], 'ep'), app.selection_cube(donnees['cube'], 'cost'))
+    donnees['epargne'] = app.epargne_mensuelle(donnees['cube'])
+    return donnees
+
+def rapport_compte(chemin, dossier_sortie, format_agregats='parquet'):
+    """
+    Ecriture des agrégats et des figures html d'un compte dans dossier_sortie/<nom du fichier>/
+
+    Input :
+        chemin : chemin de l'export csv du compte
+        dossier_sortie : dossier des rapports
+        format_agregats : 'parquet' ou 'json'
+
+    Output :
+        resultat : dictionnaire {'fichier', 'lignes', 'duree_s', 'erreur'}
+    """
+    debut = time.perf_counter()
+    resultat = {'fichier': os.path.basename(chemin), 'lignes': 0, 'erreur': None}
+    try:
+        donnees = analyse_compte(chemin)
+        resultat['lignes'] = len(donnees['transactions'])
+
+        dossier = os.path.join(dossier_sortie, os.path.splitext(os.path.basename(chemin))[0])
+        os.makedirs(dossier, exist_ok=True)
+        for nom, agregat in agregats.items():
+            df = agregat(donnees)
+            if format_agregats == 'parquet':
+                df.to_parquet(os.path.join(dossier, f'{nom}.parquet'), index=False)
+            else:
+                df.to_json(os.path.join(dossier, f'{nom}.json'), orient='records', date_format='iso', force_ascii=False)
+        for nom, figure in figures.items():
+            figure(donnees).write_html(os.path.join(dossier, f'{nom}.html'), include_plotlyjs='cdn')
+    except (ValueError, KeyError, MemoryError) as erreur:
+        # Un export illisible ou trop volumineux n'interrompt pas le traitement des autres comptes
+        resultat['erreur'] = f'{type(erreur).__name__}: {erreur}'
+    resultat['duree_s'] = time.perf_counter() - debut
+    return resultat
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Génération des rapports (agrégats et figures html) d'un dossier d'exports bancaires csv")
+    parser.add_argument('dossier', help="dossier des exports csv, un fichier par compte")
+    parser.add_argument('--sortie', default='rapports', help="dossier des rapports")
+    parser.add_argument('--format', choices=['parquet', 'json'], default='parquet', help="format des agrégats")
+    parser.add_argument('--processus', type=int, default=os.cpu_count(), help="nombre de processus")
+    parser.add_argument('--memoire-max', type=int, help="mémoire maximale par processus en Mo (Unix)")
+    parser.add_argument('--fichiers-par-processus', type=int, default=20, help="nombre de fichiers traités avant de relancer un processus (libère la mémoire fragmentée)")
+    args = parser.parse_args()
+
+    chemins = sorted(os.path.join(args.dossier, f) for f in os.listdir(args.dossier) if f.lower().endswith('.csv'))
+    debut = time.perf_counter()
+    resultats = []
+    with ProcessPoolExecutor(max_workers=args.processus, initializer=limite_memoire, initargs=(args.memoire_max,),
+                             max_tasks_per_child=args.fichiers_par_processus) as executeur:
+        taches = [executeur.submit(rapport_compte, chemin, args.sortie, args.format) for chemin in chemins]
+        for tache in as_completed(taches):
+            resultat = tache.result()
+            resultats.append(resultat)
+            statut = resultat['erreur'] or f"{resultat['lignes']} lignes"
+            print(f"{resultat['fichier']:<40} {resultat['duree_s']:>8.2f} s  {statut}")
+    duree = time.perf_counter() - debut
+
+    lignes = sum(r['lignes'] for r in resultats)
+    resume = {
+        'fichiers': len(resultats),
+        'erreurs': sum(r['erreur'] is not None for r in resultats),
+        'lignes': lignes,
+        'duree_s': duree,
+        'fichiers_par_s': len(resultats) / duree,
+        'lignes_par_s': lignes / duree,
+        'resultats': sorted(resultats, key=lambda r: r['fichier']),
+    }
+    os.makedirs(args.sortie, exist_ok=True)
+    with open(os.path.join(args.sortie, 'resume.json'), 'w') as f:
+        json.dump(resume, f, indent=2)
+    print(f"{resume['fichiers']} fichiers ({resume['erreurs']} erreurs), {lignes} lignes en {duree:.1f} s : "
+          f"{resume['fichiers_par_s']:.2f} fichiers/s, {resume['lignes_par_s']:.0f} lignes/s")